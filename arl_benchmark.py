@@ -0,0 +1,328 @@
+############################################
+# ARL BENCHMARK
+############################################
+
+# Compare the bitset Eclat miner with mlxtend apriori on synthetic basket data at several support thresholds,
+# and time + memory-profile every stage of the association rule pipeline over a grid of data sizes and supports.
+
+# 1. Synthetic Basket Data
+# 2. Eclat vs Apriori
+# 3. Pipeline Benchmark Suite
+# 4. Script
+
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import mlxtend
+import numpy as np
+import pandas as pd
+import scipy
+from mlxtend.frequent_patterns import apriori, association_rules
+
+from arl_mining import eclat
+from basket_matrix import basket_matrix_to_df, create_basket_df, create_basket_matrix
+from retail_data import retail_data_prep
+from rule_index import RuleIndex
+
+
+############################################
+# 1. Synthetic Basket Data
+############################################
+
+def basket_lengths(n_baskets, mean_basket_len=8, distribution="poisson", rng=None):
+    '''
+    parameters:
+        n_baskets: number of baskets.
+        mean_basket_len: mean number of lines per basket.
+        distribution: "poisson", "geometric" (many small baskets, a long tail) or "lognormal" (heavier tail).
+        rng: numpy random generator.
+    returns:
+        int64 array of basket lengths (at least 1).
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    if distribution == "poisson":
+        lens = rng.poisson(mean_basket_len, n_baskets)
+    elif distribution == "geometric":
+        lens = rng.geometric(1.0 / max(mean_basket_len, 1), n_baskets)
+    elif distribution == "lognormal":
+        # sigma=1: the mean of lognormal(mu, 1) is exp(mu + 0.5).
+        lens = np.rint(rng.lognormal(np.log(mean_basket_len) - 0.5, 1.0, n_baskets))
+    else:
+        raise ValueError(f"unknown basket length distribution: {distribution}")
+    return np.maximum(lens, 1).astype(np.int64)
+
+
+def synthetic_transactions(n_baskets=20000, n_items=500, mean_basket_len=8, zipf_a=1.2, seed=42,
+                           basket_len_dist="poisson", retail_columns=False):
+    '''
+    parameters:
+        n_baskets: number of baskets (invoices).
+        n_items: catalog size.
+        mean_basket_len: mean number of lines per basket (at least 1).
+        zipf_a: skew of item popularity. higher values concentrate sales on fewer items.
+        seed: random seed.
+        basket_len_dist: distribution of basket lengths (see basket_lengths).
+        retail_columns: add the other online_retail_II columns (Description, InvoiceDate, Price, Customer ID, Country)
+                        with string invoices/stock codes, cancelled invoices, POST lines and missing customers,
+                        so that retail_data_prep has something to filter.
+    returns:
+        transactions dataframe with columns Invoice, StockCode, Quantity (and the retail columns).
+    '''
+    rng = np.random.default_rng(seed)
+    basket_lens = basket_lengths(n_baskets, mean_basket_len, basket_len_dist, rng)
+    # item popularity follows a zipf distribution over the catalog.
+    popularity = 1.0 / np.arange(1, n_items + 1) ** zipf_a
+    popularity /= popularity.sum()
+    items = rng.choice(n_items, size=basket_lens.sum(), p=popularity)
+    invoices = np.repeat(np.arange(n_baskets), basket_lens)
+    transactions = pd.DataFrame({"Invoice": invoices,
+                                 "StockCode": items,
+                                 "Quantity": rng.integers(1, 10, len(items))})
+    if not retail_columns:
+        return transactions
+
+    n_rows = len(transactions)
+    # 2% of the invoices are cancelled ("C" prefix), 1% of the lines are postage.
+    cancelled = rng.random(n_baskets) < 0.02
+    invoice_labels = np.char.add(np.where(cancelled, "C", ""), (489434 + np.arange(n_baskets)).astype(str))
+    stock_codes = (10000 + items).astype(str)
+    stock_codes[rng.random(n_rows) < 0.01] = "POST"
+    customers = rng.integers(12346, 18288, n_baskets).astype(np.float64)
+    customers[rng.random(n_baskets) < 0.2] = np.nan
+    countries = np.array(["United Kingdom", "Germany", "France", "EIRE", "Spain"])
+    return transactions.assign(
+        Invoice=invoice_labels[invoices],
+        StockCode=stock_codes,
+        Description=np.char.add("PRODUCT ", stock_codes),
+        InvoiceDate=pd.Timestamp("2010-12-01") + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 60, n_baskets))[invoices],
+                                                                   unit="min"),
+        Price=np.round(rng.lognormal(1.0, 0.8, n_rows), 2),
+        **{"Customer ID": customers[invoices]},
+        Country=countries[rng.choice(len(countries), n_baskets, p=[0.8, 0.06, 0.06, 0.04, 0.04])][invoices])
+
+
+############################################
+# 2. Eclat vs Apriori
+############################################
+
+def benchmark_eclat_vs_apriori(transactions, supports=(0.05, 0.02, 0.01, 0.005)):
+    '''
+    parameters:
+        transactions: transactions dataframe with Invoice, StockCode and Quantity columns.
+        supports: min_support values to compare.
+    returns:
+        dataframe with elapsed seconds of both miners and number of itemsets for each support.
+    '''
+    basket_matrix, basket_ids, item_ids = create_basket_matrix(transactions)
+    basket_df = basket_matrix_to_df(basket_matrix, basket_ids, item_ids)
+
+    results = []
+    for min_support in supports:
+        start = time.perf_counter()
+        eclat_itemsets = eclat(basket_matrix, item_ids, min_support=min_support, use_colnames=True)
+        eclat_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        apriori_itemsets = apriori(basket_df, min_support=min_support, use_colnames=True)
+        apriori_seconds = time.perf_counter() - start
+
+        results.append({"min_support": min_support,
+                        "itemsets": len(eclat_itemsets),
+                        "same_itemsets": set(eclat_itemsets["itemsets"]) == set(apriori_itemsets["itemsets"]),
+                        "eclat_seconds": eclat_seconds,
+                        "apriori_seconds": apriori_seconds,
+                        "speedup": apriori_seconds / eclat_seconds})
+    return pd.DataFrame(results)
+
+
+############################################
+# 3. Pipeline Benchmark Suite
+############################################
+
+# Stages of online_retail_arl.py:
+#   ingest: read the transactions file, prep: retail_data_prep, pivot: invoice-product dataframe,
+#   apriori (or eclat): frequent itemsets, association_rules: rules,
+#   recommender: arl_recommender (sort + scan of all rules per query), rule_index: RuleIndex build + queries.
+# Every stage is timed without tracing. With profile_memory the stage is run again under tracemalloc
+# (tracing slows Python code down) to get its peak allocated memory.
+
+DEFAULT_GRID = {"n_baskets": (5000, 20000),
+                "n_items": (500,),
+                "mean_basket_len": (8,),
+                "basket_len_dist": ("poisson",),
+                "zipf_a": (1.2,),
+                "min_support": (0.02, 0.01)}
+
+
+def profile_stage(function, *args, profile_memory=True, **kwargs):
+    '''
+    returns:
+        result of function, elapsed seconds, peak memory allocated during the call in bytes (None without profiling).
+    '''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    if not profile_memory:
+        return result, seconds, None
+
+    del result
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak_bytes
+
+
+def _arl_recommender(rules_df, product_ids, metric="lift", rec_count=1):
+    # arl_recommender of the scripts: sort all rules and scan the antecedents on every call.
+    recommendations = []
+    for product_id in product_ids:
+        sorted_rules = rules_df.sort_values(metric, ascending=False)
+        recommendation_list = []
+        for antecedent, consequent in zip(sorted_rules["antecedents"], sorted_rules["consequents"]):
+            if product_id in antecedent:
+                recommendation_list.append(next(iter(consequent)))
+        recommendations.append(recommendation_list[:rec_count])
+    return recommendations
+
+
+def _rule_index_recommender(rules_df, product_ids, metric="lift", rec_count=1):
+    rule_index = RuleIndex(rules_df, metrics=(metric,))
+    return [rule_index.recommend(product_id, metric, rec_count) for product_id in product_ids]
+
+
+def benchmark_pipeline(transactions, supports=(0.02, 0.01), algorithm="apriori", n_queries=100,
+                       profile_memory=True, work_dir=None):
+    '''
+    parameters:
+        transactions: synthetic_transactions(retail_columns=True) output.
+        supports: min_support values. ingest, prep and pivot run once, the other stages once per support.
+        algorithm: "apriori" or "eclat".
+        n_queries: number of products that are recommended for (the most frequent antecedent products).
+        profile_memory: also measure the peak memory of every stage.
+        work_dir: directory of the temporary transactions file. None uses a temporary directory.
+    returns:
+        list of dictionaries -- stage, min_support, seconds, peak_bytes, rows (output size of the stage).
+    '''
+    results = []
+
+    def run(stage, support, function, *args, **kwargs):
+        output, seconds, peak_bytes = profile_stage(function, *args, profile_memory=profile_memory, **kwargs)
+        results.append({"stage": stage, "min_support": support, "seconds": seconds, "peak_bytes": peak_bytes,
+                        "rows": len(output)})
+        return output
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        path = os.path.join(directory, "transactions.csv")
+        transactions.to_csv(path, index=False)
+        dataframe = run("ingest", None, pd.read_csv, path, dtype={"Invoice": str, "StockCode": str},
+                        parse_dates=["InvoiceDate"])
+
+    dataframe = run("prep", None, retail_data_prep, dataframe)
+    basket_df = run("pivot", None, create_basket_df, dataframe, "Invoice", "StockCode", "Quantity")
+
+    for min_support in supports:
+        if algorithm == "eclat":
+            frequent_itemsets = run("eclat", min_support, eclat, basket_df, min_support=min_support,
+                                    use_colnames=True)
+        else:
+            frequent_itemsets = run("apriori", min_support, apriori, basket_df, min_support=min_support,
+                                    use_colnames=True)
+        if len(frequent_itemsets) == 0:
+            continue
+        rules = run("association_rules", min_support, association_rules, frequent_itemsets, metric="support",
+                    min_threshold=min_support)
+        product_ids = pd.Series([item for items in rules["antecedents"] for item in items]).value_counts()
+        product_ids = list(product_ids.index[:n_queries])
+        run("recommender", min_support, _arl_recommender, rules, product_ids)
+        run("rule_index", min_support, _rule_index_recommender, rules, product_ids)
+    return results
+
+
+def run_benchmark_suite(grid=None, output_path="arl_benchmark_results.json", algorithm="apriori", n_queries=100,
+                        profile_memory=True, seed=42):
+    '''
+    parameters:
+        grid: dictionary -- synthetic_transactions parameter (or "min_support"): values. Missing keys use DEFAULT_GRID.
+        output_path: json file of the results. None does not write a file.
+        algorithm, n_queries, profile_memory: same as benchmark_pipeline.
+        seed: random seed of the synthetic data.
+    returns:
+        results dataframe -- one row per data configuration, support and stage.
+    '''
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    data_params = ("n_baskets", "n_items", "mean_basket_len", "basket_len_dist", "zipf_a")
+
+    rows = []
+    for values in itertools.product(*(grid[param] for param in data_params)):
+        config = dict(zip(data_params, values))
+        transactions = synthetic_transactions(**config, seed=seed, retail_columns=True)
+        for result in benchmark_pipeline(transactions, grid["min_support"], algorithm, n_queries, profile_memory):
+            rows.append({**config, "transactions": len(transactions), **result})
+    results = pd.DataFrame(rows)
+
+    if output_path is not None:
+        environment = {"python": platform.python_version(), "platform": platform.platform(),
+                       "numpy": np.__version__, "pandas": pd.__version__, "scipy": scipy.__version__,
+                       "mlxtend": mlxtend.__version__, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(output_path, "w") as file:
+            json.dump({"environment": environment, "grid": grid, "algorithm": algorithm,
+                       "results": results.to_dict(orient="records")}, file, indent=1)
+    return results
+
+
+def compare_benchmarks(baseline_path, path, max_ratio=1.5, min_seconds=0.05):
+    '''
+    parameters:
+        baseline_path, path: run_benchmark_suite output files.
+        max_ratio: a stage is a regression if it is slower (or uses more memory) than max_ratio times the baseline.
+        min_seconds: stages faster than this are not checked for time regressions (timer noise).
+    returns:
+        dataframe of all stages with seconds/peak_bytes ratios and a regression column. The apriori and eclat
+        stages are compared as one "mining" stage (miner columns keep the algorithm names). only_in is "baseline"
+        or "new" for stages that are in one file only (no ratios), None for the stages in both files.
+    '''
+    keys = ["n_baskets", "n_items", "mean_basket_len", "basket_len_dist", "zipf_a", "min_support", "stage"]
+    frames = []
+    for file_path in (baseline_path, path):
+        with open(file_path) as file:
+            frame = pd.DataFrame(json.load(file)["results"])
+        # the support-independent stages have no min_support. -1 lets them be merged.
+        frame = frame.assign(min_support=frame["min_support"].fillna(-1))
+        # runs with different miners are compared on the mining stage.
+        mining = frame["stage"].isin(["apriori", "eclat"])
+        frames.append(frame.assign(miner=frame["stage"].where(mining),
+                                   stage=frame["stage"].mask(mining, "mining")))
+    comparison = frames[0].merge(frames[1], on=keys, how="outer", suffixes=("_baseline", ""), indicator=True)
+    comparison["only_in"] = comparison["_merge"].map({"left_only": "baseline", "right_only": "new", "both": None})
+    comparison["seconds_ratio"] = comparison["seconds"] / comparison["seconds_baseline"]
+    comparison["memory_ratio"] = comparison["peak_bytes"] / comparison["peak_bytes_baseline"]
+    comparison["regression"] = (((comparison["seconds_ratio"] > max_ratio) & (comparison["seconds"] >= min_seconds))
+                                | (comparison["memory_ratio"] > max_ratio))
+    return comparison[keys + ["miner_baseline", "miner", "only_in", "seconds_baseline", "seconds", "seconds_ratio",
+                              "peak_bytes_baseline", "peak_bytes", "memory_ratio", "regression"]]
+
+
+############################################
+# 4. Script
+############################################
+
+# python arl_benchmark.py [results.json]
+
+if __name__ == "__main__":
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', 500)
+
+    transactions = synthetic_transactions()
+    print(benchmark_eclat_vs_apriori(transactions))
+
+    output_path = sys.argv[1] if len(sys.argv) > 1 else "arl_benchmark_results.json"
+    print(run_benchmark_suite(output_path=output_path))
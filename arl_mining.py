@@ -0,0 +1,522 @@
+############################################
+# FREQUENT ITEMSET MINING (Bitset Eclat)
+############################################
+
+# Frequent itemsets are mined with the Eclat algorithm on a vertical data layout:
+# every item keeps the set of baskets (tid-list) that contain it as a packed uint64 bitset.
+# The support of an itemset is the popcount of the AND of its items' bitsets.
+# The output has the same format as mlxtend apriori (columns: support, itemsets)
+# so mlxtend association_rules and create_rules can use it without any change.
+
+# 1. Vertical Bitsets
+# 2. Eclat
+# 3. Itemset Counting
+# 4. Segment Mining (rules for every country at once)
+# 5. Top-k Rule Generation
+# 6. Out-of-core Mining (SON)
+
+import heapq
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import apriori, association_rules
+from scipy import sparse
+
+from basket_matrix import basket_matrix_to_df, codes_to_basket_matrix, create_basket_matrix
+
+
+############################################
+# 1. Vertical Bitsets
+############################################
+
+# number of set bits for each byte value. used when numpy does not have bitwise_count (numpy < 2.0).
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(bitsets):
+    '''
+    parameters:
+        bitsets: 2D uint64 array. each row is a packed bitset.
+    returns:
+        number of set bits in each row.
+    '''
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitsets).sum(axis=1, dtype=np.int64)
+    bytes_ = np.ascontiguousarray(bitsets).view(np.uint8).reshape(len(bitsets), -1)
+    return _POPCOUNT_TABLE[bytes_].sum(axis=1, dtype=np.int64)
+
+
+def item_bitsets(basket_matrix):
+    '''
+    parameters:
+        basket_matrix: boolean scipy sparse matrix -- rows: baskets, columns: items.
+    returns:
+        uint64 array of shape (number of items, number of 64-bit words).
+        bit b of word w in row i is set if basket w*64+b contains item i.
+    '''
+    basket_matrix = sparse.csc_matrix(basket_matrix)
+    basket_matrix.eliminate_zeros()
+    n_baskets, n_items = basket_matrix.shape
+    n_words = max((n_baskets + 63) // 64, 1)
+
+    baskets = basket_matrix.indices.astype(np.int64)
+    items = np.repeat(np.arange(n_items, dtype=np.int64), np.diff(basket_matrix.indptr))
+
+    bitsets = np.zeros(n_items * n_words, dtype=np.uint64)
+    np.bitwise_or.at(bitsets,
+                     items * n_words + (baskets >> 6),
+                     np.left_shift(np.uint64(1), (baskets & 63).astype(np.uint64)))
+    return bitsets.reshape(n_items, n_words)
+
+
+############################################
+# 2. Eclat
+############################################
+
+def eclat(basket_matrix, item_ids=None, min_support=0.5, use_colnames=False, max_len=None):
+    '''
+    parameters:
+        basket_matrix: basket-item matrix. boolean scipy sparse matrix or a (sparse) boolean/0-1 dataframe.
+        item_ids: item labels of the matrix columns. Not needed for dataframes (columns are used).
+        min_support: minimum support of itemsets to be returned.
+        use_colnames: use item labels instead of column indices in itemsets (same as apriori).
+        max_len: maximum length of itemsets. None means no limit.
+    returns:
+        dataframe with columns 'support' and 'itemsets' (frozensets) -- same as mlxtend apriori.
+    '''
+    if isinstance(basket_matrix, pd.DataFrame):
+        item_ids = basket_matrix.columns
+        if hasattr(basket_matrix, "sparse"):
+            basket_matrix = basket_matrix.sparse.to_coo()
+        else:
+            basket_matrix = sparse.csr_matrix(basket_matrix.to_numpy(dtype=bool))
+
+    n_baskets = basket_matrix.shape[0]
+    if n_baskets == 0:
+        return pd.DataFrame({"support": pd.Series(dtype=float), "itemsets": pd.Series(dtype=object)})
+
+    # an itemset is frequent if its basket count is at least min_count.
+    min_count = max(int(np.ceil(min_support * n_baskets - 1e-9)), 1)
+    bitsets = item_bitsets(basket_matrix)
+    counts = popcount_rows(bitsets)
+
+    frequent_items = np.flatnonzero(counts >= min_count)
+    itemsets = [(int(counts[i]), (int(i),)) for i in frequent_items]
+
+    if max_len is None or max_len > 1:
+        _eclat_extend((), frequent_items, bitsets[frequent_items], min_count, max_len, itemsets)
+
+    # same ordering as apriori: shorter itemsets first, then by column index.
+    itemsets.sort(key=lambda x: (len(x[1]), x[1]))
+
+    if use_colnames:
+        labels = np.asarray(item_ids, dtype=object)
+        sets = [frozenset(labels[list(items)]) for _, items in itemsets]
+    else:
+        sets = [frozenset(items) for _, items in itemsets]
+
+    supports = np.array([count for count, _ in itemsets], dtype=np.float64) / n_baskets
+    return pd.DataFrame({"support": supports, "itemsets": sets})
+
+
+def _eclat_extend(prefix, items, bitsets, min_count, max_len, itemsets):
+    # items: frequent extensions of prefix (column indices in ascending order)
+    # bitsets: tid-list bitsets of prefix + each item
+    for k in range(len(items) - 1):
+        new_prefix = prefix + (int(items[k]),)
+        # intersect prefix+item k with every later extension at once.
+        intersections = bitsets[k + 1:] & bitsets[k]
+        counts = popcount_rows(intersections)
+        keep = np.flatnonzero(counts >= min_count)
+        if len(keep) == 0:
+            continue
+        for j in keep:
+            itemsets.append((int(counts[j]), new_prefix + (int(items[k + 1 + j]),)))
+        if max_len is None or len(new_prefix) + 2 <= max_len:
+            _eclat_extend(new_prefix, items[k + 1:][keep], intersections[keep], min_count, max_len, itemsets)
+
+
+############################################
+# 3. Itemset Counting
+############################################
+
+def count_itemsets(bitsets, itemsets, chunk_size=4096):
+    '''
+    parameters:
+        bitsets: item bitsets (output of item_bitsets).
+        itemsets: list of tuples of column indices.
+        chunk_size: number of itemsets that are intersected at once.
+    returns:
+        number of baskets that contain each itemset.
+    '''
+    counts = np.zeros(len(itemsets), dtype=np.int64)
+    lengths = np.array([len(items) for items in itemsets], dtype=np.int64)
+    # itemsets with the same length are counted together.
+    for length in np.unique(lengths[lengths > 0]):
+        positions = np.flatnonzero(lengths == length)
+        codes = np.array([itemsets[p] for p in positions], dtype=np.int64)
+        for start in range(0, len(positions), chunk_size):
+            block = codes[start:start + chunk_size]
+            intersections = bitsets[block[:, 0]]
+            for column in range(1, length):
+                intersections = intersections & bitsets[block[:, column]]
+            counts[positions[start:start + chunk_size]] = popcount_rows(intersections)
+    return counts
+
+
+############################################
+# 4. Segment Mining
+############################################
+
+# create_rules mines one country at a time and filters + pivots the whole dataframe for each country.
+# create_segment_rules encodes the transactions once, sorts them by segment (e.g. Country) and mines
+# every segment in a process pool. Workers read their rows from shared memory arrays; no dataframe is pickled.
+
+def create_segment_rules(dataframe, segment_col="Country", basket_col="Invoice", item_col="StockCode",
+                         value_col="Quantity", segments=None, min_support=0.01, metric="support",
+                         min_threshold=0.01, algorithm="eclat", n_jobs=None):
+    '''
+    parameters:
+        dataframe: cleaned transactions dataframe (retail_data_prep output).
+        segment_col: column to partition the transactions by.
+        basket_col, item_col, value_col: same as create_basket_matrix.
+        segments: segments to mine. If None, every segment in the dataframe is mined.
+        min_support, metric, min_threshold: same as apriori and association_rules in create_rules.
+        algorithm: "eclat" or "apriori".
+        n_jobs: number of worker processes. None uses all CPUs, 1 mines the segments in this process.
+    returns:
+        rules: dictionary -- segment: association rules dataframe.
+        timings: dataframe with the number of baskets, the number of rules and the elapsed seconds of each segment.
+    '''
+    # encode the transactions once.
+    segment_codes, segment_ids = pd.factorize(dataframe[segment_col], sort=True)
+    basket_codes, _ = pd.factorize(dataframe[basket_col])
+    item_codes, item_ids = pd.factorize(dataframe[item_col], sort=True)
+    values = np.ones(len(dataframe)) if value_col is None else dataframe[value_col].to_numpy(dtype=np.float64)
+
+    valid = (segment_codes >= 0) & (basket_codes >= 0) & (item_codes >= 0)
+    order = np.flatnonzero(valid)[np.argsort(segment_codes[valid], kind="stable")]
+    arrays = {"basket_codes": basket_codes[order].astype(np.int64),
+              "item_codes": item_codes[order].astype(np.int32),
+              "values": values[order]}
+    # rows of segment s are bounds[s]:bounds[s + 1] of the sorted arrays.
+    bounds = np.r_[0, np.cumsum(np.bincount(segment_codes[order], minlength=len(segment_ids)))]
+
+    if segments is None:
+        segments = list(segment_ids)
+    segment_positions = pd.Index(segment_ids).get_indexer(segments)
+    tasks = [(segment, bounds[position], bounds[position + 1]) for segment, position in zip(segments, segment_positions)
+             if position >= 0]
+    params = (len(item_ids), min_support, metric, min_threshold, algorithm)
+
+    shared = {name: _share_array(array) for name, array in arrays.items()}
+    specs = {name: spec for name, (_, spec) in shared.items()}
+    try:
+        if n_jobs == 1:
+            results = [_mine_segment(specs, start, end, params) for _, start, end in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_mine_segment, specs, start, end, params) for _, start, end in tasks]
+                results = [future.result() for future in futures]
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+    # itemsets of the workers are item codes. convert them to item labels.
+    labels = np.asarray(item_ids, dtype=object)
+    rules, timings = {}, []
+    for (segment, _, _), (segment_rules, n_baskets, seconds) in zip(tasks, results):
+        for column in ("antecedents", "consequents"):
+            segment_rules[column] = [frozenset(labels[list(items)]) for items in segment_rules[column]]
+        rules[segment] = segment_rules
+        timings.append({segment_col: segment, "baskets": n_baskets, "rules": len(segment_rules), "seconds": seconds})
+    return rules, pd.DataFrame(timings)
+
+
+def _share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _mine_segment(specs, start, end, params):
+    n_items, min_support, metric, min_threshold, algorithm = params
+    started = time.perf_counter()
+
+    # copy the rows of the segment from shared memory.
+    arrays = {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:end].copy()
+        shm.close()
+
+    basket_ids, basket_codes = np.unique(arrays["basket_codes"], return_inverse=True)
+    basket_matrix = codes_to_basket_matrix(basket_codes.ravel(), arrays["item_codes"], arrays["values"],
+                                           (len(basket_ids), n_items))
+    if algorithm == "apriori":
+        frequent_itemsets = apriori(basket_matrix_to_df(basket_matrix, basket_ids, np.arange(n_items)),
+                                    min_support=min_support)
+    else:
+        frequent_itemsets = eclat(basket_matrix, min_support=min_support)
+    if len(frequent_itemsets) == 0:
+        rules = pd.DataFrame(columns=["antecedents", "consequents"])
+    else:
+        rules = association_rules(frequent_itemsets, metric=metric, min_threshold=min_threshold)
+    return rules, len(basket_ids), time.perf_counter() - started
+
+
+############################################
+# 5. Top-k Rule Generation
+############################################
+
+# association_rules returns every rule above min_threshold. At low supports this is millions of rules,
+# but the recommenders only read the best few rules of each antecedent.
+# topk_association_rules streams the rules of each frequent itemset and keeps only the best k rules of every
+# antecedent in a bounded min-heap. With a memory budget, k is lowered (and then min_threshold is raised)
+# whenever the kept rules would use more memory than the budget.
+
+# approximate memory of one kept rule (heap entry + antecedent/consequent frozensets).
+RULE_BYTES = 512
+
+RULE_METRICS = {
+    "support": lambda sAC, sA, sC: np.full(len(sA), sAC),
+    "confidence": lambda sAC, sA, sC: sAC / sA,
+    "lift": lambda sAC, sA, sC: sAC / sA / sC,
+    "leverage": lambda sAC, sA, sC: sAC - sA * sC,
+}
+
+
+def rule_metrics(sAC, sA, sC):
+    '''
+    parameters:
+        sAC, sA, sC: arrays of rule, antecedent and consequent supports.
+    returns:
+        dictionary of the association_rules metric columns.
+    '''
+    confidence = sAC / sA
+    leverage = sAC - sA * sC
+    with np.errstate(divide="ignore", invalid="ignore"):
+        conviction = np.where(confidence == 1, np.inf, (1 - sC) / (1 - confidence))
+        denominator = np.maximum(sAC * (1 - sA), sA * (sC - sAC))
+        zhangs_metric = np.where(denominator == 0, 0, leverage / denominator)
+    return {"antecedent support": sA, "consequent support": sC, "support": sAC, "confidence": confidence,
+            "lift": confidence / sC, "leverage": leverage, "conviction": conviction, "zhangs_metric": zhangs_metric}
+
+
+def topk_association_rules(frequent_itemsets, metric="lift", k=5, min_threshold=None, memory_budget=None):
+    '''
+    parameters:
+        frequent_itemsets: apriori/eclat output (columns: support, itemsets).
+        metric: metric to rank the rules of an antecedent by -- support, confidence, lift or leverage.
+        k: maximum number of rules per antecedent.
+        min_threshold: minimum metric value of a rule (same as association_rules). None keeps every rule.
+        memory_budget: maximum memory of the kept rules in bytes (approximate, RULE_BYTES per rule). None is unlimited.
+    returns:
+        association rules dataframe with the same columns as association_rules, sorted by metric in descending order.
+    '''
+    metric_function = RULE_METRICS[metric]
+    supports = dict(zip(frequent_itemsets["itemsets"], frequent_itemsets["support"].to_numpy(dtype=np.float64)))
+    max_rules = None if memory_budget is None else max(int(memory_budget // RULE_BYTES), 1)
+    threshold = -np.inf if min_threshold is None else min_threshold
+
+    # antecedent: min-heap of (metric value, -order, consequent). heap[0] is the weakest kept rule.
+    heaps = {}
+    n_kept = 0
+    order = 0
+    for itemset, sAC in supports.items():
+        if len(itemset) < 2:
+            continue
+        items = sorted(itemset, key=repr)
+        antecedents = [frozenset(antecedent) for length in range(1, len(items))
+                       for antecedent in combinations(items, length)]
+        consequents = [itemset - antecedent for antecedent in antecedents]
+        sA = np.array([supports[antecedent] for antecedent in antecedents])
+        sC = np.array([supports[consequent] for consequent in consequents])
+        values = metric_function(sAC, sA, sC)
+
+        for antecedent, consequent, value in zip(antecedents, consequents, values.tolist()):
+            if value < threshold:
+                continue
+            order += 1
+            heap = heaps.setdefault(antecedent, [])
+            if len(heap) < k:
+                heapq.heappush(heap, (value, -order, consequent))
+                n_kept += 1
+            elif (value, -order) > heap[0][:2]:
+                heapq.heapreplace(heap, (value, -order, consequent))
+
+        if max_rules is not None and n_kept > max_rules:
+            k, threshold, n_kept = _shrink_heaps(heaps, k, threshold, max_rules)
+
+    rules = [(antecedent, consequent) for antecedent, heap in heaps.items() for _, _, consequent in heap]
+    sA = np.array([supports[antecedent] for antecedent, _ in rules], dtype=np.float64)
+    sC = np.array([supports[consequent] for _, consequent in rules], dtype=np.float64)
+    sAC = np.array([supports[antecedent | consequent] for antecedent, consequent in rules], dtype=np.float64)
+
+    rules_df = pd.DataFrame({"antecedents": [antecedent for antecedent, _ in rules],
+                             "consequents": [consequent for _, consequent in rules],
+                             **rule_metrics(sAC, sA, sC)})
+    return rules_df.sort_values(metric, ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _shrink_heaps(heaps, k, threshold, max_rules):
+    # lower k so that every antecedent fits in the budget. if one rule per antecedent is still too much,
+    # raise the threshold to the median kept value and drop the antecedents without rules.
+    k = max(min(k, max_rules // max(len(heaps), 1)), 1)
+    for heap in heaps.values():
+        while len(heap) > k:
+            heapq.heappop(heap)
+    n_kept = sum(len(heap) for heap in heaps.values())
+    while n_kept > max_rules:
+        values = np.array([value for heap in heaps.values() for value, _, _ in heap])
+        new_threshold = np.median(values)
+        # the median must drop at least one rule.
+        threshold = new_threshold if (values < new_threshold).any() else np.nextafter(new_threshold, np.inf)
+        for antecedent in list(heaps):
+            heap = heaps[antecedent]
+            while heap and heap[0][0] < threshold:
+                heapq.heappop(heap)
+            if not heap:
+                del heaps[antecedent]
+        n_kept = sum(len(heap) for heap in heaps.values())
+    return k, threshold, n_kept
+
+
+############################################
+# 6. Out-of-core Mining (SON)
+############################################
+
+# apriori and eclat need the whole basket-item matrix in memory. son_frequent_itemsets reads the cleaned
+# transactions in chunks twice (SON algorithm):
+#   1. pass: mine every chunk with the same min_support (scaled to the chunk's number of baskets)
+#      and take the union of the locally frequent itemsets as candidates.
+#      A globally frequent itemset is frequent in at least one chunk, so no frequent itemset is missed.
+#   2. pass: count the candidates in every chunk and keep the ones with global support >= min_support.
+# Only one chunk (per worker) is in memory at a time, so the peak memory depends on the chunk size.
+# The rows of a basket must be consecutive (as in online_retail_II); basket_chunks moves the rows of the last
+# basket of a chunk to the next chunk so that no basket is split.
+
+# candidates of the second pass. set once in every worker process (pool initializer).
+_son_state = {}
+
+
+def basket_chunks(chunks, basket_col="Invoice"):
+    '''
+    parameters:
+        chunks: iterable of transactions dataframes. rows of a basket are consecutive.
+        basket_col: basket id column.
+    returns:
+        generator of dataframes that contain whole baskets.
+    '''
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        if len(chunk) == 0:
+            continue
+        baskets = chunk[basket_col].to_numpy()
+        # rows of the last basket wait for the next chunk.
+        last = len(baskets)
+        while last > 0 and baskets[last - 1] == baskets[-1]:
+            last -= 1
+        carry = chunk.iloc[last:]
+        if last > 0:
+            yield chunk.iloc[:last]
+    if carry is not None and len(carry) > 0:
+        yield carry
+
+
+def son_frequent_itemsets(read_chunks, min_support=0.01, basket_col="Invoice", item_col="StockCode",
+                          value_col="Quantity", max_len=None, n_jobs=1):
+    '''
+    parameters:
+        read_chunks: function that returns a new iterator of cleaned transactions chunks on every call,
+                     e.g. lambda: (retail_data_prep(chunk, thresholds=thresholds)
+                                   for chunk in pd.read_csv("online_retail.csv", chunksize=500000)).
+        min_support: minimum support of itemsets in all baskets.
+        basket_col, item_col, value_col: same as create_basket_matrix.
+        max_len: maximum length of itemsets. None means no limit.
+        n_jobs: number of worker processes. 1 processes the chunks in this process, None uses all CPUs.
+    returns:
+        dataframe with columns 'support' and 'itemsets' (frozensets of item labels) -- the same itemsets as
+        apriori(use_colnames=True) on all transactions.
+    '''
+    columns = (basket_col, item_col, value_col)
+
+    # 1. pass: locally frequent itemsets of every chunk.
+    candidates = set()
+    for local_itemsets in _map_chunks(_son_local_itemsets, basket_chunks(read_chunks(), basket_col), n_jobs,
+                                      (columns, min_support, max_len)):
+        candidates.update(local_itemsets)
+
+    # candidates are encoded with one item vocabulary for the second pass.
+    item_ids = sorted({item for itemset in candidates for item in itemset}, key=repr)
+    item_codes = {item: code for code, item in enumerate(item_ids)}
+    candidates = [tuple(sorted(item_codes[item] for item in itemset)) for itemset in candidates]
+
+    # 2. pass: global counts of the candidates.
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    n_baskets = 0
+    for chunk_counts, chunk_baskets in _map_chunks(_son_count, basket_chunks(read_chunks(), basket_col), n_jobs,
+                                                   (columns,), _son_init, (item_codes, candidates)):
+        counts += chunk_counts
+        n_baskets += chunk_baskets
+
+    min_count = max(int(np.ceil(min_support * n_baskets - 1e-9)), 1)
+    labels = np.asarray(item_ids, dtype=object)
+    itemsets = sorted((items, count) for items, count in zip(candidates, counts.tolist()) if count >= min_count)
+    itemsets.sort(key=lambda x: len(x[0]))
+    return pd.DataFrame({"support": np.array([count for _, count in itemsets], dtype=np.float64) / max(n_baskets, 1),
+                         "itemsets": [frozenset(labels[list(items)]) for items, _ in itemsets]})
+
+
+def _map_chunks(function, chunks, n_jobs, params, initializer=None, initargs=()):
+    # results of function(chunk, *params) for every chunk, in any order.
+    # at most 2 * n_jobs chunks are waiting in the pool at a time.
+    if n_jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield function(chunk, *params)
+        return
+
+    max_pending = 2 * (n_jobs or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(function, chunk, *params))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def _son_local_itemsets(chunk, columns, min_support, max_len):
+    basket_matrix, _, item_ids = create_basket_matrix(chunk, *columns)
+    return set(eclat(basket_matrix, item_ids, min_support=min_support, use_colnames=True, max_len=max_len)["itemsets"])
+
+
+def _son_init(item_codes, candidates):
+    _son_state["item_codes"] = item_codes
+    _son_state["candidates"] = candidates
+
+
+def _son_count(chunk, columns):
+    basket_matrix, basket_ids, item_ids = create_basket_matrix(chunk, *columns)
+    item_codes = _son_state["item_codes"]
+    # map the chunk columns to the candidate vocabulary. items that are not in any candidate are dropped.
+    codes = np.array([item_codes.get(item, -1) for item in item_ids], dtype=np.int64)
+    basket_matrix = sparse.coo_matrix(basket_matrix)
+    keep = codes[basket_matrix.col] >= 0
+    basket_matrix = sparse.csr_matrix((basket_matrix.data[keep], (basket_matrix.row[keep],
+                                                                  codes[basket_matrix.col[keep]])),
+                                      shape=(len(basket_ids), len(item_codes)))
+    return count_itemsets(item_bitsets(basket_matrix), _son_state["candidates"]), len(basket_ids)
@@ -9,6 +9,7 @@
 
 # 1. Data Preprocessing
 # 2: Extract Association Rules and Recommend Service.
+# 3: Rules of the Last N Months (Sliding Window)
 
 
 #########################
@@ -27,6 +28,9 @@
 
 import pandas as pd
 from mlxtend.frequent_patterns import apriori, association_rules
+from armut_data import basket_labels, encode_armut, month_partitions, service_labels
+from basket_matrix import basket_matrix_to_df, codes_to_basket_matrix
+from incremental_rules import WindowedRuleMiner
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
@@ -47,9 +51,11 @@ df.head()
 ## 1.2: Create a new variable to represent these services by combining ServiceId (row[1]) and CategoryId (row[2]) with "_".
 #       ServiceID represents a different service for each CategoryID.
 
-# using list comprehension the column is generated by concatenating the second and third elements of each row with an underscore _ in between.
+# encode_armut (armut_data.py) creates integer codes with vectorized arithmetic instead of concatenating strings per row:
+# ServiceCode: code of the (ServiceId, CategoryId) pair.
+# services: ServiceId and CategoryId of each ServiceCode. service_labels(services) gives the "ServiceId_CategoryId" labels.
 
-df["Service"] = [str(row[1]) + '_' + str(row[2]) for row in df.values]
+df, services, baskets = encode_armut(df)
 df.head()
 
 
@@ -58,28 +64,23 @@ df.head()
 # The data set consists of the date and time the services were received, there is no basket definition (invoice, etc.).
 # In order to apply Association Rule Learning, a basket (invoice, etc.) definition must be created.
 # Here, the basket definition is the services (CategoryId_ServiceId) that each customer receives monthly.
-# Baskets must be identified with a unique ID. -- "BasketId"
-# To do this, first create a new date variable that contains only the year and month. -- "CreateDate"
-# Combine UserID and the date variable you just created with "_" and assign it to a new variable called BasketId.
+# Baskets must be identified with a unique ID. -- "BasketCode"
+# MonthIndex = year * 12 + month - 1 of 'CreateDate' (no strftime over the whole column).
+# BasketCode: code of the (UserId, MonthIndex) pair. basket_labels(baskets, codes) gives the 'userID_Year_Month' labels.
 
 # check DType of columns.
 df.info()
 df.head()
 
-# convert 'CreateDate' type to datetime.
-df["CreateDate"] = pd.to_datetime(df["CreateDate"])
+# labels are created only for the rows that are displayed.
+df_head = df.head()
+df_head[["UserId", "ServiceId", "CategoryId", "CreateDate"]].assign(
+    Service=service_labels(services, df_head["ServiceCode"]),
+    BasketId=basket_labels(baskets, df_head["BasketCode"]))
 
-# create new variable showing service's year and month info as YYYY_MM. - fifth column.
-df["Year_Month"] = df["CreateDate"].dt.strftime("%Y-%m")
-
-# create "BasketID" in the form 'userID_Year_Month'
-# row[0]: userID, row[5]: Year_Month
-df["BasketId"] = [str(row[0]) + '_' + str(row[5]) for row in df.values]
-
-
-#    UserId  ServiceId  CategoryId          CreateDate Service Year_Month       BasketId
-# 0   25446          4           5 2017-08-06 16:11:00     4_5    2017-08  25446_2017-08
-# 1   22948         48           5 2017-08-06 16:12:00    48_5    2017-08  22948_2017-08
+#    UserId  ServiceId  CategoryId          CreateDate Service       BasketId
+# 0   25446          4           5 2017-08-06 16:11:00     4_5  25446_2017-08
+# 1   22948         48           5 2017-08-06 16:12:00    48_5  22948_2017-08
 
 
 
@@ -99,16 +100,19 @@ df["BasketId"] = [str(row[0]) + '_' + str(row[5]) for row in df.values]
 # 10000_2017-08    0     0      0     0      0     0     0     0     0     0..
 
 
-# Count 'Service' for each 'BasketId'. Then represent counts as binary using applymap.
-# If count is greater than zero change to 1. If count equals to zero change to zero.
+# Each 'Service' that appears in a 'BasketId' is represented as 1 (True), otherwise 0 (False).
+# The sparse matrix is built directly from the integer codes. Columns are labeled as 'ServiceId_CategoryId'
+# so the rules can be read, rows keep the basket codes.
 
-invoice_product_df = df.groupby(['BasketId', 'Service'])['Service'].count().unstack().fillna(0).applymap(lambda x: 1 if x > 0 else 0)
-invoice_product_df.head()
+basket_matrix = codes_to_basket_matrix(df["BasketCode"].to_numpy(), df["ServiceCode"].to_numpy(),
+                                       shape=(len(baskets), len(services)))
+invoice_product_df_bool = basket_matrix_to_df(basket_matrix, baskets.index, service_labels(services),
+                                              "BasketCode", "Service")
+invoice_product_df = invoice_product_df_bool.astype(pd.SparseDtype("int8", 0))
+invoice_product_df.head().set_axis(basket_labels(baskets, invoice_product_df.index[:5]), axis=0)
 
 # [71220 rows x 50 columns]
 
-invoice_product_df_bool = df.groupby(['BasketId', 'Service'])['Service'].count().unstack().fillna(0).applymap(lambda x: True if x > 0 else False)
-
 
 ## 2.2 : Create association rules.
 
@@ -145,3 +149,29 @@ def arl_recommender_metric(rules_df, product_id, metric, rec_count=1):
 recommended_services=arl_recommender(rules, "2_0", rec_count=3)
 
 print(recommended_services)
+
+
+#############################
+#### 3: Rules of the Last N Months (Sliding Window)
+#############################
+
+# Rules of all months reflect old demand as well. WindowedRuleMiner (incremental_rules.py) keeps the baskets of the
+# last 'window' months as monthly partitions, with the counts of the tracked itemsets in each month.
+# When a new month is added, its baskets are counted and the expired month's counts are subtracted;
+# the other months are scanned only for new candidate itemsets.
+
+window_miner = WindowedRuleMiner(min_support=0.01, window=6)
+partitions = list(month_partitions(df, services))
+window_miner.fit(partitions[:-1])
+
+# slide the window: add the newest month (the oldest month leaves the window).
+month, month_basket_matrix, month_services = partitions[-1]
+window_miner.update_partition(month, month_basket_matrix, month_services)
+window_miner.keys
+
+# daily refresh: the baskets of the current month are replaced with the same month key.
+window_miner.update_partition(month, month_basket_matrix, month_services)
+
+# publish a fresh rule index for the current window.
+window_rule_index = window_miner.rule_index(metric="support", min_threshold=0.01)
+window_rule_index.recommend("2_0", "lift", rec_count=3)
@@ -0,0 +1,118 @@
+############################################
+# ARMUT DATA (Service and Basket Encoding)
+############################################
+
+# armut_arl.py builds the "Service" (ServiceId_CategoryId) and "BasketId" (UserId_YYYY-MM) strings row by row.
+# encode_armut derives integer codes instead:
+#   - ServiceCode: code of the (ServiceId, CategoryId) pair,
+#   - MonthIndex: year * 12 + month - 1 of CreateDate,
+#   - BasketCode: code of the (UserId, MonthIndex) pair.
+# String labels are produced only for the codes that are displayed (service_labels, basket_labels).
+
+# 1. Encoding
+# 2. Labels
+# 3. Monthly Partitions
+
+import numpy as np
+import pandas as pd
+
+from basket_matrix import codes_to_basket_matrix
+
+
+############################################
+# 1. Encoding
+############################################
+
+def month_index(dates):
+    # number of months since year 0. consecutive months have consecutive indices.
+    dates = pd.to_datetime(dates)
+    return (dates.dt.year.to_numpy(dtype=np.int64) * 12 + dates.dt.month.to_numpy(dtype=np.int64) - 1)
+
+
+def encode_armut(dataframe):
+    '''
+    parameters:
+        dataframe: armut dataframe with UserId, ServiceId, CategoryId and CreateDate columns.
+    returns:
+        dataframe: copy of the dataframe with ServiceCode, MonthIndex and BasketCode columns.
+        services: dataframe -- index: ServiceCode, columns: ServiceId, CategoryId.
+        baskets: dataframe -- index: BasketCode, columns: UserId, MonthIndex.
+    '''
+    service_ids = dataframe["ServiceId"].to_numpy(dtype=np.int64)
+    category_ids = dataframe["CategoryId"].to_numpy(dtype=np.int64)
+    user_ids = dataframe["UserId"].to_numpy(dtype=np.int64)
+    months = month_index(dataframe["CreateDate"])
+
+    # (ServiceId, CategoryId) and (UserId, MonthIndex) pairs are packed into single int64 keys and factorized.
+    n_categories = int(category_ids.max(initial=0)) + 1
+    service_codes, service_keys = pd.factorize(service_ids * n_categories + category_ids, sort=True)
+    first_month = int(months.min(initial=0))
+    n_months = int(months.max(initial=0)) - first_month + 1
+    basket_codes, basket_keys = pd.factorize(user_ids * n_months + (months - first_month), sort=True)
+
+    services = pd.DataFrame({"ServiceId": service_keys // n_categories,
+                             "CategoryId": service_keys % n_categories})
+    services.index.name = "ServiceCode"
+    baskets = pd.DataFrame({"UserId": basket_keys // n_months,
+                            "MonthIndex": basket_keys % n_months + first_month})
+    baskets.index.name = "BasketCode"
+
+    dataframe = dataframe.assign(ServiceCode=service_codes.astype(np.int32),
+                                 MonthIndex=months.astype(np.int32),
+                                 BasketCode=basket_codes.astype(np.int32))
+    return dataframe, services, baskets
+
+
+############################################
+# 2. Labels
+############################################
+
+def service_labels(services, codes=None):
+    '''
+    returns:
+        "ServiceId_CategoryId" labels of the service codes (all services if codes is None).
+    '''
+    selected = services if codes is None else services.loc[codes]
+    return (selected["ServiceId"].astype(str) + "_" + selected["CategoryId"].astype(str)).to_numpy()
+
+
+def basket_labels(baskets, codes=None):
+    '''
+    returns:
+        "UserId_YYYY-MM" labels of the basket codes (all baskets if codes is None).
+    '''
+    selected = baskets if codes is None else baskets.loc[codes]
+    years, months = np.divmod(selected["MonthIndex"].to_numpy(), 12)
+    return (selected["UserId"].astype(str).to_numpy() + "_"
+            + pd.Series(years).astype(str).to_numpy() + "-"
+            + pd.Series(months + 1).astype(str).str.zfill(2).to_numpy())
+
+
+############################################
+# 3. Monthly Partitions
+############################################
+
+def month_partitions(dataframe, services, months=None):
+    '''
+    parameters:
+        dataframe: encode_armut output dataframe.
+        services: encode_armut services dataframe.
+        months: month indices to return. If None, every month in the dataframe is returned.
+    returns:
+        generator of (MonthIndex, basket_matrix, service labels) -- input of WindowedRuleMiner.fit/update_partition.
+        rows of basket_matrix are the baskets (users) of the month, columns are all services.
+    '''
+    labels = service_labels(services)
+    month_values = dataframe["MonthIndex"].to_numpy()
+    order = np.argsort(month_values, kind="stable")
+    sorted_months = month_values[order]
+    basket_codes = dataframe["BasketCode"].to_numpy()[order]
+    service_codes = dataframe["ServiceCode"].to_numpy()[order]
+
+    if months is None:
+        months = np.unique(sorted_months)
+    for month in months:
+        start, end = np.searchsorted(sorted_months, [month, month + 1])
+        month_baskets, codes = np.unique(basket_codes[start:end], return_inverse=True)
+        yield int(month), codes_to_basket_matrix(codes.ravel(), service_codes[start:end],
+                                                 shape=(len(month_baskets), len(services))), labels
@@ -13,6 +13,10 @@
 
 import pandas as pd
 from mlxtend.frequent_patterns import apriori, association_rules
+from arl_mining import eclat
+from basket_matrix import create_basket_df
+from retail_data import ProductCatalog, load_retail_data, retail_data_prep
+from rule_index import RuleIndex
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
@@ -27,8 +31,9 @@ pd.set_option('display.expand_frame_repr', False)
 # dataset:
 # https://archive.ics.uci.edu/ml/datasets/Online+Retail+II
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx",
-                    sheet_name="Year 2010-2011", engine="openpyxl")
+# pd.read_excel("datasets/online_retail_II.xlsx", sheet_name="Year 2010-2011", engine="openpyxl") takes minutes.
+# load_retail_data reads the sheet once with openpyxl and then reads a columnar cache.
+df_ = load_retail_data("datasets/online_retail_II.xlsx", sheet_name="Year 2010-2011")
 
 df = df_.copy()
 df.head()
@@ -38,39 +43,16 @@ df.describe()
 # We can delete the rows containing missing values since the number of rows is enough.
 # We need to trim the outliers that appear as max values.
 
-# detect outlier thresholds using interquartile range method.
-def outlier_thresholds(dataframe, variable):
-    quartile1 = dataframe[variable].quantile(0.01)
-    quartile3 = dataframe[variable].quantile(0.99)
-    interquantile_range = quartile3 - quartile1
-    up_limit = quartile3 + 1.5 * interquantile_range
-    low_limit = quartile1 - 1.5 * interquantile_range
-    return low_limit, up_limit
+# retail_data_prep (retail_data.py) does all steps below in one pass:
+# - one boolean mask for all filters, so the rows are copied only once:
+#     drop missing values,
+#     drop return invoices (Invoice starts with 'C') to not include returns,
+#     do not include negative values of 'Quantity' and 'Price'.
+# - detect outlier thresholds using interquartile range method (0.01 and 0.99 quantiles).
+# - replace the outliers with threshold values (lower and upper limits) using np.clip.
+# drop_stock_codes=() keeps the POST rows in this analysis.
 
-# replace the outliers with threshold values (lower and upper limits)
-
-def replace_with_thresholds(dataframe, variable):
-    low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
-
-def retail_data_prep(dataframe):
-    # drop missing values
-    dataframe.dropna(inplace=True)
-
-    # drop return invoices to not include returns.
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-
-    # do not include negative values of 'Quantity' and 'Price'
-    dataframe = dataframe[dataframe["Quantity"] > 0]
-    dataframe = dataframe[dataframe["Price"] > 0]
-
-    # handle the outliers
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    return dataframe
-
-df = retail_data_prep(df)
+df = retail_data_prep(df, drop_stock_codes=())
 
 # check the missing values
 df.isnull().sum()
@@ -124,12 +106,9 @@ df_fr.groupby(['Invoice', 'StockCode']). \
 # id=True >> analysis will be done with 'StockCode' column instead of 'Description' column.
 
 def create_invoice_product_df(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
+    item_col = "StockCode" if id else "Description"
+    # sparse 1/0 invoice-product dataframe built from integer codes in one pass.
+    return create_basket_df(dataframe, "Invoice", item_col, "Quantity").astype(pd.SparseDtype("int8", 0))
 
 
 fr_inv_pro_df = create_invoice_product_df(df_fr)
@@ -138,23 +117,23 @@ fr_inv_pro_df = create_invoice_product_df(df_fr)
 # show quantity values as True or False for better performance.
 
 def create_invoice_product_df_bool(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
+    item_col = "StockCode" if id else "Description"
+    # sparse True/False invoice-product dataframe. apriori uses it without densifying.
+    return create_basket_df(dataframe, "Invoice", item_col, "Quantity")
 
 # ARL dataframe >>>
 fr_inv_pro_df_bool = create_invoice_product_df_bool(df_fr, id=True)
 
 
 # use function check_id to get the item name from a stockcode.
-def check_id(dataframe, stock_code):
-    product_name = dataframe[dataframe["StockCode"] == stock_code][["Description"]].values[0].tolist()
+# ProductCatalog keeps the most frequent Description of each StockCode, so the dataframe is not scanned for each lookup.
+def check_id(catalog, stock_code):
+    product_name = catalog.name(stock_code)
     print(product_name)
+    return product_name
 
-check_id(df_fr, 10120)
+catalog_fr = ProductCatalog(df_fr)
+check_id(catalog_fr, 10120)
 
 
 
@@ -223,8 +202,9 @@ rules = create_rules(df)
 # 4. Recommending Products to Customers
 ############################################
 
+catalog = ProductCatalog(df)
 product_id = 22492
-check_id(df, product_id)
+check_id(catalog, product_id)
 
 # Which antecendents values contains 'product_id'?
 # What are the consequents corresponding those selected antecedents?
@@ -245,7 +225,7 @@ for i, product in enumerate(sorted_rules["antecedents"]):
 
 recommendation_list[0:3]
 
-check_id(df, 22326)
+check_id(catalog, 22326)
 
 # write function
 
@@ -281,47 +261,26 @@ recommended_product_ids=arl_recommender_metric(rules, 22492, metric="lift", rec_
 # 5. Script
 ############################################
 
-def outlier_thresholds(dataframe, variable):
-    quartile1 = dataframe[variable].quantile(0.01)
-    quartile3 = dataframe[variable].quantile(0.99)
-    interquantile_range = quartile3 - quartile1
-    up_limit = quartile3 + 1.5 * interquantile_range
-    low_limit = quartile1 - 1.5 * interquantile_range
-    return low_limit, up_limit
-
-def replace_with_thresholds(dataframe, variable):
-    low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
-
-def retail_data_prep(dataframe):
-    dataframe.dropna(inplace=True)
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    dataframe = dataframe[dataframe["Quantity"] > 0]
-    dataframe = dataframe[dataframe["Price"] > 0]
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    return dataframe
-
-
 def create_invoice_product_df_bool(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
+    item_col = "StockCode" if id else "Description"
+    # sparse True/False invoice-product dataframe. apriori uses it without densifying.
+    return create_basket_df(dataframe, "Invoice", item_col, "Quantity")
 
 
-def check_id(dataframe, stock_code):
-    product_name = dataframe[dataframe["StockCode"] == stock_code][["Description"]].values[0].tolist()
+def check_id(catalog, stock_code):
+    product_name = catalog.name(stock_code)
     print(product_name)
+    return product_name
 
 
-def create_rules(dataframe, id=True, country="France"):
+def create_rules(dataframe, id=True, country="France", algorithm="apriori"):
     dataframe = dataframe[dataframe['Country'] == country]
     dataframe = create_invoice_product_df_bool(dataframe, id)
-    frequent_itemsets = apriori(dataframe, min_support=0.01, use_colnames=True)
+    # algorithm="eclat": bitset based miner from arl_mining.py. returns the same format as apriori.
+    if algorithm == "eclat":
+        frequent_itemsets = eclat(dataframe, min_support=0.01, use_colnames=True)
+    else:
+        frequent_itemsets = apriori(dataframe, min_support=0.01, use_colnames=True)
     rules = association_rules(frequent_itemsets, metric="support", min_threshold=0.01)
     return rules
 
@@ -352,7 +311,7 @@ def arl_recommender_metric(rules_df, product_id, metric, rec_count=1):
 df = df_.copy()
 
 # data preprocessing
-df = retail_data_prep(df)
+df = retail_data_prep(df, drop_stock_codes=())
 
 # Association Rules Extraction
 rules = create_rules(df)
@@ -362,4 +321,9 @@ recommended_product_ids=arl_recommender_metric(rules, 22492, metric="lift", rec_
 
 print(recommended_product_ids)
 
+# rule index: rules are sorted once for every metric, recommendations are answered by lookup.
+rule_index = RuleIndex(rules)
+recommended_product_ids = rule_index.recommend(22492, metric="lift", rec_count=4)
+recommended_product_names = ProductCatalog(df).bulk_names(recommended_product_ids)
+
 
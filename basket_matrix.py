@@ -0,0 +1,91 @@
+############################################
+# BASKET MATRIX (Sparse Invoice-Product Matrix)
+############################################
+
+# Builds the basket-item matrix used by association rule learning in one vectorized pass.
+# Basket and item ids are factorized to integer codes and the matrix is stored as a boolean scipy CSR matrix,
+# so no Python function runs per cell and the mostly-zero matrix is never materialized as dense floats.
+
+# 1. Sparse Basket Matrix
+# 2. Sparse Basket Dataframe (input format of mlxtend apriori)
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+############################################
+# 1. Sparse Basket Matrix
+############################################
+
+def create_basket_matrix(dataframe, basket_col="Invoice", item_col="StockCode", value_col="Quantity"):
+    '''
+    parameters:
+        dataframe: transactions dataframe. Each row is an item in a basket.
+        basket_col: column that identifies the baskets (rows of the matrix).
+        item_col: column that identifies the items (columns of the matrix).
+        value_col: column whose sum per basket-item decides if the item is in the basket (sum > 0).
+                   If None, every basket-item pair in the dataframe is counted as present.
+    returns:
+        basket_matrix: boolean scipy CSR matrix of shape (number of baskets, number of items).
+        basket_ids: basket labels of the matrix rows (sorted).
+        item_ids: item labels of the matrix columns (sorted).
+    '''
+    # integer codes of baskets and items. sort=True keeps the same order as groupby().unstack().
+    basket_codes, basket_ids = pd.factorize(dataframe[basket_col], sort=True)
+    item_codes, item_ids = pd.factorize(dataframe[item_col], sort=True)
+
+    # rows with missing basket or item ids get the code -1. do not include them.
+    valid = (basket_codes >= 0) & (item_codes >= 0)
+    basket_codes = basket_codes[valid].astype(np.int32, copy=False)
+    item_codes = item_codes[valid].astype(np.int32, copy=False)
+
+    values = None if value_col is None else dataframe[value_col].to_numpy(dtype=np.float64)[valid]
+    basket_matrix = codes_to_basket_matrix(basket_codes, item_codes, values, (len(basket_ids), len(item_ids)))
+    return basket_matrix, basket_ids, item_ids
+
+
+def codes_to_basket_matrix(basket_codes, item_codes, values=None, shape=None):
+    '''
+    parameters:
+        basket_codes, item_codes: integer codes of the basket and the item of each row.
+        values: value of each row. If None, every basket-item pair is counted as present.
+        shape: (number of baskets, number of items). If None, it is taken from the largest codes.
+    returns:
+        boolean scipy CSR matrix. item is in the basket if its summed value is greater than zero.
+    '''
+    if values is None:
+        values = np.ones(len(basket_codes), dtype=np.float64)
+    if shape is None:
+        shape = (int(basket_codes.max(initial=-1)) + 1, int(item_codes.max(initial=-1)) + 1)
+
+    # duplicate basket-item pairs are summed while converting to CSR format.
+    summed = sparse.csr_matrix((values, (basket_codes, item_codes)), shape=shape)
+    summed.sum_duplicates()
+
+    basket_matrix = sparse.csr_matrix((summed.data > 0, summed.indices, summed.indptr), shape=summed.shape)
+    basket_matrix.eliminate_zeros()
+    return basket_matrix
+
+
+############################################
+# 2. Sparse Basket Dataframe
+############################################
+
+# mlxtend apriori accepts dataframes with sparse boolean columns, so the basket matrix does not need to be densified.
+
+def create_basket_df(dataframe, basket_col="Invoice", item_col="StockCode", value_col="Quantity"):
+    '''
+    parameters: same as create_basket_matrix.
+    returns:
+        sparse boolean dataframe -- index: basket ids, columns: item ids.
+    '''
+    basket_matrix, basket_ids, item_ids = create_basket_matrix(dataframe, basket_col, item_col, value_col)
+    return basket_matrix_to_df(basket_matrix, basket_ids, item_ids, basket_col, item_col)
+
+
+def basket_matrix_to_df(basket_matrix, basket_ids, item_ids, basket_col=None, item_col=None):
+    # index and column names are the same as groupby([basket_col, item_col]).unstack() output.
+    return pd.DataFrame.sparse.from_spmatrix(basket_matrix.tocsc(),
+                                             index=pd.Index(basket_ids, name=basket_col),
+                                             columns=pd.Index(item_ids, name=item_col))
@@ -0,0 +1,179 @@
+############################################
+# APPROXIMATE NEAREST NEIGHBORS (Neighbor Graph)
+############################################
+
+# Exact similarities of a new or edited movie need a pass over the whole TF-IDF matrix.
+# NeighborGraphIndex is a navigable neighbor graph (single layer HNSW-style) over the L2 normalized TF-IDF rows:
+#   - every movie is linked to its top-k most similar movies (topk_cosine_similarity) and to the movies that
+#     have it among their top-k (reverse links), so the graph is connected through similar movies.
+#   - a query starts from a few entry movies and repeatedly moves to the neighbors of the best movies found so far
+#     (beam search). Only the visited movies are scored with exact cosine similarity.
+# Recall knob: ef (beam width). Larger ef visits more movies: higher recall, slower queries.
+# Random hyperplane LSH needs very short hashes for the low cosine similarities (0.1 - 0.3) of short overviews,
+# which makes its buckets almost as large as the catalog. The graph search does not have this problem.
+# recall_at_k measures the recall against exact cosine similarity for a sample of query overviews.
+
+# 1. Neighbor Graph Index
+# 2. Recall Check
+
+import heapq
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from content_similarity import l2_normalized, top_k_rows, topk_cosine_similarity
+
+
+############################################
+# 1. Neighbor Graph Index
+############################################
+
+class NeighborGraphIndex:
+    '''
+    parameters:
+        degree: number of nearest neighbors linked to every movie.
+        ef: default beam width of queries (at least k).
+        n_entry: number of random entry movies of a query.
+        seed: random seed of the entry movies.
+    '''
+
+    def __init__(self, degree=16, ef=64, n_entry=32, seed=42):
+        self.degree = degree
+        self.ef = ef
+        self.n_entry = n_entry
+        self.seed = seed
+
+    def fit(self, tfidf_matrix, neighbors=None, block_size=1000):
+        '''
+        parameters:
+            tfidf_matrix: sparse matrix -- rows: movies, columns: words.
+            neighbors: precomputed top-k neighbors (topk_cosine_similarity output). If None, they are computed.
+            block_size: block size of topk_cosine_similarity.
+        '''
+        self.matrix = l2_normalized(tfidf_matrix)
+        n_rows = self.matrix.shape[0]
+        if neighbors is None:
+            neighbors, _ = topk_cosine_similarity(self.matrix, k=self.degree, block_size=block_size)
+        neighbors = neighbors[:, :self.degree]
+
+        # links of movie i: links[indptr[i]:indptr[i + 1]] -- its neighbors and the movies that have it as a neighbor.
+        sources = np.repeat(np.arange(n_rows, dtype=np.int32), neighbors.shape[1])
+        targets = neighbors.ravel()
+        links = sparse.csr_matrix((np.ones(2 * len(targets), dtype=bool),
+                                   (np.r_[sources, targets], np.r_[targets, sources])), shape=(n_rows, n_rows))
+        self.indptr = links.indptr.astype(np.int64)
+        self.links = links.indices.astype(np.int32)
+
+        rng = np.random.default_rng(self.seed)
+        self.entry_points = rng.choice(n_rows, size=min(self.n_entry, n_rows), replace=False).astype(np.int32)
+        return self
+
+    def _score(self, rows, query):
+        # cosine similarities of movies (rows) with a dense query vector, read from the CSR arrays directly.
+        starts = self.matrix.indptr[rows]
+        lengths = self.matrix.indptr[rows + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+        values = self.matrix.data[positions] * query[self.matrix.indices[positions]]
+        return np.bincount(np.repeat(np.arange(len(rows)), lengths), weights=values, minlength=len(rows))
+
+    def _search(self, query, k, ef, exclude, batch=4):
+        # beam search over the graph. query: dense normalized query vector.
+        # every step expands the best (up to batch) unexpanded movies at once.
+        visited = np.zeros(self.matrix.shape[0], dtype=bool)
+        visited[self.entry_points] = True
+        beam_rows = self.entry_points
+        beam_scores = self._score(beam_rows, query)
+        # max-heap of the movies to expand.
+        candidates = [(-score, int(row)) for score, row in zip(beam_scores.tolist(), beam_rows)]
+        heapq.heapify(candidates)
+        n_visited = len(beam_rows)
+
+        while candidates:
+            # the worst score in a full beam. movies below it cannot improve the beam.
+            threshold = np.partition(beam_scores, len(beam_scores) - ef)[len(beam_scores) - ef] \
+                if len(beam_scores) >= ef else -np.inf
+            expand = []
+            while candidates and len(expand) < batch and -candidates[0][0] >= threshold:
+                expand.append(heapq.heappop(candidates)[1])
+            if not expand:
+                break
+
+            links = np.concatenate([self.links[self.indptr[row]:self.indptr[row + 1]] for row in expand])
+            new_rows = np.unique(links[~visited[links]])
+            if len(new_rows) == 0:
+                continue
+            visited[new_rows] = True
+            n_visited += len(new_rows)
+            new_scores = self._score(new_rows, query)
+
+            better = new_scores >= threshold
+            for score, row in zip(new_scores[better].tolist(), new_rows[better].tolist()):
+                heapq.heappush(candidates, (-score, row))
+            beam_rows = np.r_[beam_rows, new_rows[better]]
+            beam_scores = np.r_[beam_scores, new_scores[better]]
+            if len(beam_scores) > ef:
+                keep = np.argpartition(-beam_scores, ef - 1)[:ef]
+                beam_rows, beam_scores = beam_rows[keep], beam_scores[keep]
+
+        if exclude is not None:
+            keep = beam_rows != exclude
+            beam_rows, beam_scores = beam_rows[keep], beam_scores[keep]
+        order = np.argsort(-beam_scores, kind="stable")[:k]
+        return beam_rows[order], beam_scores[order], n_visited
+
+    def query(self, vectors, k=10, ef=None, exclude=None):
+        '''
+        parameters:
+            vectors: sparse matrix of query rows in the same feature space (e.g. tfidf.transform(new overviews)).
+            k: number of neighbors.
+            ef: beam width. None uses self.ef. It is raised to k + 1 if smaller.
+            exclude: row index to leave out of the result of each query (e.g. the movie itself), or None.
+        returns:
+            neighbors: int32 array (number of queries, k), scores: float32 array (number of queries, k).
+            -1 / -inf fill the rows that have fewer than k results.
+        '''
+        ef = max(self.ef if ef is None else ef, k + 1)
+        vectors = normalize(sparse.csr_matrix(vectors, dtype=np.float32))
+        neighbors = np.full((vectors.shape[0], k), -1, dtype=np.int32)
+        scores = np.full((vectors.shape[0], k), -np.inf, dtype=np.float32)
+        self.visited_counts = np.zeros(vectors.shape[0], dtype=np.int64)
+        for i in range(vectors.shape[0]):
+            query = vectors[i].toarray().ravel()
+            rows, row_scores, self.visited_counts[i] = self._search(query, k, ef,
+                                                                     None if exclude is None else exclude[i])
+            neighbors[i, :len(rows)] = rows
+            scores[i, :len(rows)] = row_scores
+        return neighbors, scores
+
+    def query_rows(self, rows, k=10, ef=None):
+        '''
+        returns:
+            neighbors and scores of indexed movies (rows), without the movies themselves.
+        '''
+        rows = np.asarray(rows)
+        return self.query(self.matrix[rows], k, ef, exclude=rows)
+
+
+############################################
+# 2. Recall Check
+############################################
+
+def recall_at_k(index, vectors, k=10, ef=None):
+    '''
+    parameters:
+        index: fitted NeighborGraphIndex.
+        vectors: sparse matrix of query rows, e.g. TF-IDF rows of movies that are not in the index.
+        k: number of neighbors.
+        ef: beam width of the queries.
+    returns:
+        recall: share of the exact top-k neighbors that the index returns.
+        visited: mean number of movies scored per query (the exact search scores all movies).
+    '''
+    neighbors, _ = index.query(vectors, k, ef)
+    vectors = normalize(sparse.csr_matrix(vectors, dtype=np.float32))
+    exact_neighbors, _ = top_k_rows((vectors @ index.matrix.T).toarray(), k)
+
+    hits = sum(len(np.intersect1d(found, true)) for found, true in zip(neighbors, exact_neighbors))
+    return hits / exact_neighbors.size, index.visited_counts.mean()
@@ -10,6 +10,7 @@
 # 2. Cosine Similarity Matrix
 # 3. Make Recommendation According to Similarities
 # 4. Script
+# 5. Serving and Scaling Examples
 
 # BUSINESS PROBLEM:
 # Since user login behavior is low on the online movie platform, product recommendations cannot be developed according to user habits with collaborative filtering methods.
@@ -20,9 +21,14 @@
 # 1. TF-IDF Matrix
 #################################
 
+import sys
+
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from content_ann import NeighborGraphIndex, recall_at_k
+from content_features import HashedTfidf, load_tfidf, movie_chunks, save_tfidf
+from content_similarity import ContentRecommender, compare_embeddings, svd_embeddings, topk_cosine_similarity
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
@@ -72,6 +78,27 @@ dense_tfidf_matrix=tfidf_matrix.toarray()
 # check the cosine similarities between movies using sparse matrix tfidf_matrix
 cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
 
+# cosine_sim above covers only the first 10,000 movies (tfidf_matrix was sliced): 10,000 x 10,000 float64 values.
+# for all 45,466 movies the dense N x N matrix needs about 16 GB.
+# topk_cosine_similarity (content_similarity.py) computes the similarities block by block and keeps only
+# the 10 most similar movies of each movie: neighbors (int32 movie indices) and scores (float32), most similar first.
+# the movie itself is not included, so no [1:11] slicing is needed.
+neighbors, neighbor_scores = topk_cosine_similarity(tfidf_matrix, k=10)
+neighbors[0]
+
+# a new or edited movie would need its similarities with all movies.
+# NeighborGraphIndex (content_ann.py) links every movie to its neighbors and answers a query by walking
+# the graph from a few entry movies; only the visited movies are scored. ef is the recall knob.
+ann_index = NeighborGraphIndex(degree=10, ef=64).fit(tfidf_matrix, neighbors=neighbors)
+new_overview = tfidf.transform(["A cowboy doll is profoundly threatened and jealous when a new spaceman figure "
+                                "supplants him as top toy in a boy's room."])
+ann_neighbors, ann_scores = ann_index.query(new_overview, k=10)
+# rows with fewer than k results are filled with -1.
+df['title'].iloc[ann_neighbors[0][ann_neighbors[0] >= 0]]
+
+# recall of the index against exact cosine similarity for movies that are not in the index.
+recall, visited = recall_at_k(ann_index, tfidf.transform(df['overview'].iloc[10000:10200]), k=10, ef=64)
+
 
 
 #################################
@@ -139,6 +166,106 @@ def content_based_recommender(title, cosine_sim, dataframe):
     return dataframe['title'].iloc[movie_indices]
 
 
-cosine_sim = calculate_cosine_sim(df)
-content_based_recommender('Toy Story', cosine_sim, df)
+def calculate_tfidf(dataframe):
+    tfidf = TfidfVectorizer(stop_words='english')
+    dataframe['overview'] = dataframe['overview'].fillna('')
+    # fitted vectorizer and the matrix with tf-idf scores of words from overview texts.
+    return tfidf, tfidf.fit_transform(dataframe['overview'])
+
+
+def calculate_topk_cosine_sim(tfidf_matrix, k=10):
+    # top-k neighbors of all movies without the dense N x N matrix.
+    neighbors, scores = topk_cosine_similarity(tfidf_matrix, k=k)
+    return neighbors, scores
+
+
+def content_based_recommender_topk(title, neighbors, dataframe):
+    # same as content_based_recommender with the neighbors array of calculate_topk_cosine_sim.
+    indices = pd.Series(dataframe.index, index=dataframe['title'])
+    indices = indices[~indices.index.duplicated(keep='last')]
+    movie_index = indices[title]
+    # neighbors are already sorted and do not include the movie itself.
+    return dataframe['title'].iloc[neighbors[movie_index]]
+
+
+# the dense cosine_sim is used only for the first 10,000 movies (about 16 GB for all movies).
+small_df = df.iloc[0:10000].copy()
+cosine_sim = calculate_cosine_sim(small_df)
+content_based_recommender('Toy Story', cosine_sim, small_df)
+
+# all movies: TF-IDF is fitted once and only the top 10 neighbors of every movie are kept.
+tfidf, tfidf_matrix = calculate_tfidf(df)
+neighbors, neighbor_scores = calculate_topk_cosine_sim(tfidf_matrix, k=10)
+content_based_recommender_topk('Toy Story', neighbors, df)
+
+# ContentRecommender builds the title -> row map once. Similarity rows are computed from the TF-IDF matrix
+# (or read from cosine_sim / neighbors) and the top 10 are selected with argpartition.
+# cache_size keeps the recommendations of the most recently asked titles.
+recommender = ContentRecommender(df, tfidf_matrix=tfidf_matrix, cache_size=1024)
+recommender.recommend('Toy Story', k=10)
+
+# recommendations for many titles at once. rows: titles, columns: rank.
+recommender.recommend_batch(df['title'].dropna().unique()[:100], k=10)
+
+
+
+#################################
+# 5. Serving and Scaling Examples
+#################################
 
+# the examples below write files, read movies_metadata.csv again or fit more models. They are run with:
+#   python content_based_recommendation.py --scaling-examples
+
+def saved_tfidf_example(tfidf, tfidf_matrix, dataframe, path="datasets/content_tfidf"):
+    # build step: save the fitted vectorizer, the TF-IDF matrix and the titles as raw arrays.
+    save_tfidf(tfidf, tfidf_matrix, path, titles=dataframe['title'])
+
+    # serving: the arrays are memory-mapped. No csv parsing or fitting; processes share the same pages.
+    mapped_tfidf = load_tfidf(path)
+    mapped_recommender = ContentRecommender(pd.DataFrame({"title": mapped_tfidf.titles}),
+                                            tfidf_matrix=mapped_tfidf.matrix, cache_size=1024)
+    # TF-IDF rows of new overviews with the saved vocabulary and idf weights.
+    mapped_tfidf.transform(["A cowboy doll is threatened by a new spaceman toy."])
+    return mapped_recommender.recommend('Toy Story', k=10)
+
+
+def streaming_tfidf_example(path="datasets/movies_metadata.csv"):
+    # streaming mode: the csv is read in chunks (only title and overview) twice and words are hashed into a fixed
+    # number of columns, so the memory does not depend on the vocabulary size.
+    hashed_tfidf = HashedTfidf(n_features=2 ** 20)
+    hashed_matrix, hashed_movies = hashed_tfidf.fit_transform(lambda: movie_chunks(path))
+    hashed_recommender = ContentRecommender(hashed_movies, tfidf_matrix=hashed_matrix)
+    return hashed_recommender.recommend('Toy Story', k=10)
+
+
+def append_example(dataframe, n_new=100):
+    # new movies: only their overviews are transformed (frozen vocabulary and idf) and compared with the catalog.
+    # the top-10 lists of the new movies are created and merged into the lists of existing movies they are close to.
+    # the catalog vectorizer is fitted without the new movies, as it would be before they arrive.
+    catalog_df, new_movies = dataframe.iloc[:-n_new], dataframe.iloc[-n_new:]
+    tfidf, catalog_matrix = calculate_tfidf(catalog_df.copy())
+    catalog_neighbors, catalog_scores = topk_cosine_similarity(catalog_matrix, k=10)
+    live_recommender = ContentRecommender(catalog_df, tfidf_matrix=catalog_matrix, neighbors=catalog_neighbors,
+                                          scores=catalog_scores, vectorizer=tfidf, idf_drift_threshold=0.05)
+    live_recommender.append(new_movies)
+    # refit everything when the idf weights of the grown catalog drift too far from the frozen ones.
+    print(live_recommender.idf_drift, live_recommender.needs_rebuild)
+    return live_recommender.recommend(new_movies['title'].iloc[0], k=10)
+
+
+def embedding_example(tfidf_matrix, dataframe):
+    # embedding mode: TF-IDF rows are projected to 64-256 dense float32 dimensions with randomized TruncatedSVD.
+    # similarities are BLAS dot products of the normalized embeddings.
+    embeddings, svd = svd_embeddings(tfidf_matrix, n_components=128)
+    embedding_recommender = ContentRecommender(dataframe, embeddings=embeddings, cache_size=1024)
+    print(embedding_recommender.recommend('Toy Story', k=10))
+
+    # memory, latency and top-10 overlap with the sparse TF-IDF path for several dimensions.
+    return compare_embeddings(tfidf_matrix, dimensions=(64, 128, 256), n_queries=200, k=10)
+
+
+if __name__ == "__main__" and "--scaling-examples" in sys.argv:
+    print(saved_tfidf_example(tfidf, tfidf_matrix, df))
+    print(streaming_tfidf_example())
+    print(append_example(df))
+    print(embedding_example(tfidf_matrix, df))
@@ -0,0 +1,192 @@
+############################################
+# CONTENT FEATURES (TF-IDF Persistence)
+############################################
+
+# content_based_recommendation.py reads movies_metadata.csv and fits TfidfVectorizer on every run.
+# save_tfidf writes the fitted vectorizer and the TF-IDF matrix once as raw arrays in a directory:
+#   - terms.npy: words of the matrix columns (fixed width unicode), idf.npy: idf weights (float64).
+#   - data.npy (float32), indices.npy (int32), indptr.npy (int32 or int64): CSR components of the matrix.
+#   - titles.npy: movie titles of the rows. neighbors.npy / scores.npy: top-k neighbors (optional).
+#   - meta.json: matrix shape and the vectorizer parameters.
+# load_tfidf maps the arrays with np.load(mmap_mode="r"): a serving process starts without parsing the csv or
+# fitting, and processes that load the same directory share the same pages. The sklearn vectorizer (vocabulary
+# dictionary) is built only when new texts have to be transformed.
+
+# HashedTfidf fits TF-IDF weights while reading movies_metadata.csv in chunks. Words are hashed into a fixed
+# number of columns (HashingVectorizer), so there is no vocabulary dictionary and the memory does not depend on
+# the number of distinct words:
+#   1. pass: document frequency of every column and the number of documents.
+#   2. pass: term counts * idf, L2 normalized -- the same weighting as TfidfVectorizer (smooth_idf=True).
+
+# 1. Saving and Loading TF-IDF
+# 2. Streaming Hashed TF-IDF
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+############################################
+# 1. Saving and Loading TF-IDF
+############################################
+
+def save_tfidf(tfidf, tfidf_matrix, path, titles=None, neighbors=None, scores=None):
+    '''
+    parameters:
+        tfidf: fitted TfidfVectorizer.
+        tfidf_matrix: its output -- rows: movies, columns: words.
+        path: directory to write the arrays to.
+        titles: movie titles of the matrix rows.
+        neighbors, scores: topk_cosine_similarity output.
+    '''
+    os.makedirs(path, exist_ok=True)
+    matrix = sparse.csr_matrix(tfidf_matrix, dtype=np.float32)
+    # int32 indptr is enough up to 2**31 non-zero values. scipy then keeps the mapped arrays without copying.
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    arrays = {"terms": np.asarray(tfidf.get_feature_names_out(), dtype=str),
+              "idf": np.asarray(tfidf.idf_, dtype=np.float64),
+              "data": matrix.data,
+              "indices": matrix.indices.astype(index_dtype),
+              "indptr": matrix.indptr.astype(index_dtype)}
+    if titles is not None:
+        arrays["titles"] = np.asarray([str(title) if title == title else "" for title in titles], dtype=str)
+    if neighbors is not None:
+        arrays["neighbors"] = np.asarray(neighbors, dtype=np.int32)
+    if scores is not None:
+        arrays["scores"] = np.asarray(scores, dtype=np.float32)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+    # only the parameters that can be written to json are kept (no custom tokenizer/preprocessor functions).
+    params = {name: value for name, value in tfidf.get_params().items()
+              if isinstance(value, (str, int, float, bool, list, tuple, type(None)))}
+    params["dtype"] = np.dtype(tfidf.dtype).name
+    with open(os.path.join(path, "meta.json"), "w") as file:
+        json.dump({"shape": list(matrix.shape), "arrays": list(arrays), "params": params}, file)
+
+
+def load_tfidf(path):
+    '''
+    returns:
+        MappedTfidf object that reads the arrays written by save_tfidf from memory-mapped files.
+    '''
+    return MappedTfidf(path)
+
+
+class MappedTfidf:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        self.params = meta["params"]
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="r") if name in meta["arrays"] else None
+
+        self.terms = load("terms")
+        self.idf = load("idf")
+        self.titles = load("titles")
+        self.neighbors = load("neighbors")
+        self.scores = load("scores")
+        # the csr matrix uses the mapped arrays directly (same dtypes for indices and indptr: no copy).
+        self.matrix = sparse.csr_matrix((load("data"), load("indices"), load("indptr")), shape=tuple(meta["shape"]),
+                                        copy=False)
+        self._vectorizer = None
+
+    def vectorizer(self):
+        '''
+        returns:
+            TfidfVectorizer with the saved parameters, vocabulary and idf weights (built on the first call).
+        '''
+        if self._vectorizer is None:
+            params = dict(self.params)
+            params["dtype"] = np.dtype(params["dtype"]).type
+            for name in ("ngram_range",):
+                if name in params:
+                    params[name] = tuple(params[name])
+            vectorizer = TfidfVectorizer(**params)
+            vectorizer.vocabulary_ = {str(term): column for column, term in enumerate(self.terms)}
+            vectorizer.idf_ = np.asarray(self.idf)
+            self._vectorizer = vectorizer
+        return self._vectorizer
+
+    def transform(self, texts):
+        '''
+        returns:
+            TF-IDF rows of new texts with the saved vocabulary and idf weights.
+        '''
+        return self.vectorizer().transform(texts)
+
+
+############################################
+# 2. Streaming Hashed TF-IDF
+############################################
+
+def movie_chunks(path="datasets/movies_metadata.csv", columns=("title", "overview"), chunksize=10000):
+    '''
+    returns:
+        generator of dataframe chunks with only the given columns (read as strings, missing values are "").
+    '''
+    for chunk in pd.read_csv(path, usecols=list(columns), dtype=str, chunksize=chunksize):
+        yield chunk.fillna("")
+
+
+class HashedTfidf:
+    '''
+    parameters:
+        n_features: number of hashed columns. Different words can share a column: with a vocabulary of
+                    about 75,000 words, about 7% of the words share a column at 2**20 and about 2% at 2**22.
+        stop_words: same as TfidfVectorizer.
+    '''
+
+    def __init__(self, n_features=2 ** 20, stop_words="english"):
+        self.hasher = HashingVectorizer(n_features=n_features, stop_words=stop_words, alternate_sign=False,
+                                        norm=None, dtype=np.float32)
+        self.n_documents = 0
+        self.document_frequency = np.zeros(n_features, dtype=np.int64)
+
+    def fit(self, read_chunks, text_col="overview"):
+        '''
+        parameters:
+            read_chunks: function that returns a new iterator of dataframe chunks on every call,
+                         e.g. lambda: movie_chunks("datasets/movies_metadata.csv").
+            text_col: text column.
+        '''
+        self.n_documents = 0
+        self.document_frequency[:] = 0
+        for chunk in read_chunks():
+            counts = self.hasher.transform(chunk[text_col].fillna(""))
+            # every (document, column) pair is stored once in the csr matrix.
+            self.document_frequency += np.bincount(counts.indices, minlength=len(self.document_frequency))
+            self.n_documents += counts.shape[0]
+        # smooth idf of TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        self.idf_ = (np.log((1 + self.n_documents) / (1 + self.document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, texts):
+        '''
+        returns:
+            L2 normalized TF-IDF rows (float32 csr matrix) of texts.
+        '''
+        counts = self.hasher.transform(texts)
+        counts.data *= self.idf_[counts.indices]
+        return normalize(counts)
+
+    def transform_chunks(self, read_chunks, text_col="overview", keep_cols=("title",)):
+        '''
+        returns:
+            TF-IDF matrix of all rows (stacked chunk by chunk) and a dataframe of the keep_cols columns.
+        '''
+        matrices, frames = [], []
+        for chunk in read_chunks():
+            matrices.append(self.transform(chunk[text_col].fillna("")))
+            frames.append(chunk[list(keep_cols)])
+        return sparse.vstack(matrices, format="csr"), pd.concat(frames, ignore_index=True)
+
+    def fit_transform(self, read_chunks, text_col="overview", keep_cols=("title",)):
+        return self.fit(read_chunks, text_col).transform_chunks(read_chunks, text_col, keep_cols)
@@ -0,0 +1,349 @@
+############################################
+# CONTENT SIMILARITY (Top-k Cosine Neighbors)
+############################################
+
+# cosine_similarity(tfidf_matrix, tfidf_matrix) creates a dense N x N float64 matrix (about 16 GB for 45,466 movies).
+# content_based_recommender reads only the 10 most similar movies of one row.
+# topk_cosine_similarity multiplies one block of rows with the whole sparse matrix at a time and keeps only the
+# top-k neighbors of every movie with argpartition:
+#   neighbors: int32 array (N, k) -- row indices of the most similar movies, most similar first.
+#   scores: float32 array (N, k) -- their cosine similarities.
+# Memory: N * k * 8 bytes for the result + block_size * N * 4 bytes for one block.
+
+# 1. Top-k Cosine Similarity
+# 2. Content Recommender
+# 3. Low-rank Embeddings
+
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+
+############################################
+# 1. Top-k Cosine Similarity
+############################################
+
+def l2_normalized(matrix):
+    '''
+    returns:
+        float32 CSR matrix with L2 normalized rows. TfidfVectorizer rows are already normalized (norm="l2");
+        such a matrix is returned without a copy, so memory-mapped matrices (load_tfidf) stay shared.
+    '''
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+    norms = np.sqrt(np.bincount(np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr)),
+                                weights=np.square(matrix.data, dtype=np.float64), minlength=matrix.shape[0]))
+    if np.all((np.abs(norms - 1) < 1e-4) | (norms == 0)):
+        return matrix
+    return normalize(matrix)
+
+
+def top_k_rows(block, k):
+    '''
+    parameters:
+        block: 2D array of scores.
+        k: number of columns to keep in each row.
+    returns:
+        column indices (int32) and scores (float32) of the k largest scores of each row, largest first.
+    '''
+    k = min(k, block.shape[1])
+    # argpartition finds the k largest in linear time; only these k are sorted.
+    columns = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(block, columns, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return (np.take_along_axis(columns, order, axis=1).astype(np.int32),
+            np.take_along_axis(scores, order, axis=1).astype(np.float32))
+
+
+def topk_cosine_similarity(tfidf_matrix, k=10, block_size=1000, exclude_self=True):
+    '''
+    parameters:
+        tfidf_matrix: sparse matrix -- rows: movies, columns: words (TfidfVectorizer output).
+        k: number of neighbors to keep for each movie.
+        block_size: number of rows multiplied at once.
+        exclude_self: do not return a movie as its own neighbor.
+    returns:
+        neighbors: int32 array (number of movies, k), scores: float32 array (number of movies, k).
+    '''
+    # cosine similarity of L2 normalized rows is their dot product.
+    matrix = l2_normalized(tfidf_matrix)
+    matrix_t = matrix.T.tocsc()
+    n_rows = matrix.shape[0]
+    k = min(k, n_rows - 1 if exclude_self else n_rows)
+
+    neighbors = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float32)
+    for start in range(0, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        block = (matrix[start:end] @ matrix_t).toarray()
+        if exclude_self:
+            block[np.arange(end - start), np.arange(start, end)] = -np.inf
+        neighbors[start:end], scores[start:end] = top_k_rows(block, k)
+    return neighbors, scores
+
+
+############################################
+# 2. Content Recommender
+############################################
+
+def document_frequency_from_idf(idf, n_documents):
+    '''
+    returns:
+        document frequencies of the columns, from smooth idf weights: idf = ln((1 + n) / (1 + df)) + 1
+    '''
+    return np.rint((1 + n_documents) / np.exp(np.asarray(idf, dtype=np.float64) - 1) - 1)
+
+
+# content_based_recommender builds the title -> index series, removes duplicates and sorts a dataframe of the
+# whole similarity row on every call. ContentRecommender builds the title -> row map once and selects the
+# top-k of a similarity row with argpartition. recommend_batch answers many titles with one matrix product per block.
+
+class ContentRecommender:
+    '''
+    parameters:
+        dataframe: movies dataframe with a 'title' column. rows are in the same order as the similarity source.
+        tfidf_matrix: sparse TF-IDF matrix. similarity rows are computed from it when needed.
+        cosine_sim: dense cosine similarity matrix (calculate_cosine_sim output). used instead of tfidf_matrix.
+        embeddings: L2 normalized dense embeddings (svd_embeddings output). used instead of tfidf_matrix.
+        neighbors: top-k neighbors (topk_cosine_similarity output). used instead of similarity rows.
+                   recommendations are limited to its k.
+        scores: similarity scores of neighbors. needed to merge the neighbors of appended movies (append).
+        vectorizer: fitted TF-IDF vectorizer of tfidf_matrix (TfidfVectorizer, HashedTfidf or load_tfidf output).
+                    needed to transform the overviews of appended movies.
+        cache_size: number of (title, k) results kept in an LRU cache. 0 disables the cache.
+        idf_drift_threshold: needs_rebuild becomes True when the idf drift of appended movies exceeds this value.
+    '''
+
+    def __init__(self, dataframe, tfidf_matrix=None, cosine_sim=None, neighbors=None, scores=None, vectorizer=None,
+                 cache_size=0, idf_drift_threshold=0.05, embeddings=None):
+        self.titles = dataframe["title"].to_numpy(dtype=object)
+        self.index = dataframe.index
+        # title -> row position. for duplicated titles the last movie is kept (same as keep='last').
+        self.title_rows = {title: row for row, title in enumerate(self.titles)}
+        self.cosine_sim = cosine_sim
+        self.embeddings = embeddings
+        self.neighbors = neighbors
+        self.scores = scores
+        self.vectorizer = vectorizer
+        self.idf_drift_threshold = idf_drift_threshold
+        self.idf_drift = 0.0
+        self.needs_rebuild = False
+        self.document_frequency = None
+        self.matrix = self.matrix_t = None
+        if tfidf_matrix is not None:
+            self.matrix = l2_normalized(tfidf_matrix)
+            self.matrix_t = self.matrix.T.tocsc()
+        if cache_size:
+            self._top_rows = lru_cache(maxsize=cache_size)(self._top_rows)
+
+    def similarity_rows(self, rows):
+        '''
+        returns:
+            2D float32 array of the cosine similarities of movies (row positions) with all movies.
+        '''
+        if self.cosine_sim is not None:
+            return np.asarray(self.cosine_sim[rows], dtype=np.float32)
+        if self.embeddings is not None:
+            # dense float32 matrix product (BLAS).
+            return self.embeddings[rows] @ self.embeddings.T
+        return (self.matrix[rows] @ self.matrix_t).toarray()
+
+    def _top_rows(self, row, k):
+        if self.neighbors is not None:
+            return self.neighbors[row, :k]
+        scores = self.similarity_rows([row])
+        # the movie itself is not recommended.
+        scores[0, row] = -np.inf
+        return top_k_rows(scores, k)[0][0]
+
+    def recommend(self, title, k=10):
+        '''
+        returns:
+            titles of the k most similar movies (index: dataframe index) -- same as content_based_recommender.
+        '''
+        rows = self._top_rows(self.title_rows[title], k)
+        return pd.Series(self.titles[rows], index=self.index[rows], name="title")
+
+    def recommend_batch(self, titles, k=10, block_size=1000):
+        '''
+        parameters:
+            titles: movie titles.
+            k: number of recommendations per title.
+            block_size: number of titles whose similarity rows are computed at once.
+        returns:
+            dataframe -- index: titles, columns: 0..k-1 (most similar first), values: recommended titles.
+        '''
+        rows = np.array([self.title_rows[title] for title in titles], dtype=np.int64)
+        if self.neighbors is not None:
+            top = self.neighbors[rows, :k]
+        else:
+            top = np.empty((len(rows), min(k, len(self.titles) - 1)), dtype=np.int32)
+            for start in range(0, len(rows), block_size):
+                block_rows = rows[start:start + block_size]
+                scores = self.similarity_rows(block_rows)
+                scores[np.arange(len(block_rows)), block_rows] = -np.inf
+                top[start:start + block_size] = top_k_rows(scores, k)[0]
+        return pd.DataFrame(self.titles[top], index=pd.Index(titles, name="title"))
+
+    # Refitting TfidfVectorizer and recomputing all similarities for a few new titles is not needed:
+    #   - the overviews of the new movies are transformed with the frozen vocabulary and idf weights,
+    #   - their similarities with all movies are computed in blocks,
+    #   - the top-k neighbors of the new movies are selected, and existing movies whose k-th neighbor is less similar
+    #     than a new movie get the new movie merged into their neighbor list.
+    # The idf weights are not updated, so they drift from the idf of the grown catalog. idf_drift is the mean relative
+    # change of the idf of the words in the appended overviews (weighted by their document counts); when it exceeds
+    # idf_drift_threshold, needs_rebuild is set and the vectorizer should be fitted again on all movies.
+
+    def append(self, dataframe, text_col="overview", block_size=1000):
+        '''
+        parameters:
+            dataframe: new movies with 'title' and text_col columns.
+            text_col: overview column.
+            block_size: number of new movies whose similarities are computed at once.
+        returns:
+            row positions of the new movies.
+        '''
+        # similarities of the new movies are computed from TF-IDF rows. cosine_sim / embeddings rows of the new
+        # movies would be missing.
+        if self.matrix is None or self.vectorizer is None:
+            raise ValueError("append needs a recommender created with tfidf_matrix and vectorizer")
+        if self.cosine_sim is not None or self.embeddings is not None:
+            raise ValueError("append is not supported for recommenders that use cosine_sim or embeddings")
+        n_old = len(self.titles)
+        new_matrix = l2_normalized(self.vectorizer.transform(dataframe[text_col].fillna("")))
+        self._update_idf_drift(new_matrix, n_old)
+
+        self.matrix = sparse.vstack([self.matrix, new_matrix], format="csr")
+        self.matrix_t = self.matrix.T.tocsc()
+        new_rows = np.arange(n_old, n_old + new_matrix.shape[0])
+        self.titles = np.r_[self.titles, dataframe["title"].to_numpy(dtype=object)]
+        self.index = self.index.append(dataframe.index)
+        for row, title in zip(new_rows, dataframe["title"]):
+            self.title_rows[title] = row
+        if hasattr(self._top_rows, "cache_clear"):
+            self._top_rows.cache_clear()
+
+        if self.neighbors is not None:
+            self._merge_neighbors(new_rows, block_size)
+        return new_rows
+
+    def _merge_neighbors(self, new_rows, block_size):
+        k = self.neighbors.shape[1]
+        n_old = new_rows[0]
+        # mapped (read-only) arrays are copied once.
+        neighbors = np.empty((len(self.titles), k), dtype=np.int32)
+        scores = np.full((len(self.titles), k), -np.inf, dtype=np.float32)
+        neighbors[:n_old], scores[:n_old] = self.neighbors, self.scores
+
+        for start in range(0, len(new_rows), block_size):
+            block_rows = new_rows[start:start + block_size]
+            block = (self.matrix[block_rows] @ self.matrix_t).toarray()
+            block[np.arange(len(block_rows)), block_rows] = -np.inf
+            neighbors[block_rows], scores[block_rows] = top_k_rows(block, k)
+
+            # existing movies that have a new movie above their k-th score.
+            # (new movies already have their top-k among all movies.)
+            old_scores = block[:, :n_old].T
+            affected = np.flatnonzero((old_scores > scores[:n_old, -1:]).any(axis=1))
+            if len(affected) == 0:
+                continue
+            block_top, block_scores = top_k_rows(old_scores[affected], k)
+            merged_rows = np.hstack([neighbors[affected], block_rows[block_top]])
+            merged_scores = np.hstack([scores[affected], block_scores])
+            columns, merged_top = top_k_rows(merged_scores, k)
+            neighbors[affected] = np.take_along_axis(merged_rows, columns, axis=1)
+            scores[affected] = merged_top
+        self.neighbors, self.scores = neighbors, scores
+
+    def _update_idf_drift(self, new_matrix, n_old):
+        idf = np.asarray(self.vectorizer.idf_ if hasattr(self.vectorizer, "idf_") else self.vectorizer.idf,
+                         dtype=np.float64)
+        if self.document_frequency is None:
+            # document counts of the fitted catalog and of all movies appended since then.
+            self.fit_documents = getattr(self.vectorizer, "n_documents", n_old)
+            if hasattr(self.vectorizer, "document_frequency"):
+                self.document_frequency = self.vectorizer.document_frequency.astype(np.float64)
+            else:
+                self.document_frequency = document_frequency_from_idf(idf, self.fit_documents)
+            self.appended_frequency = np.zeros(len(idf), dtype=np.float64)
+            self.appended_documents = 0
+        self.appended_frequency += np.bincount(new_matrix.indices, minlength=len(idf))
+        self.appended_documents += new_matrix.shape[0]
+
+        n_documents = self.fit_documents + self.appended_documents
+        current_idf = np.log((1 + n_documents) / (1 + self.document_frequency + self.appended_frequency)) + 1
+        used = self.appended_frequency > 0
+        if used.any():
+            self.idf_drift = float(np.average(np.abs(current_idf[used] - idf[used]) / idf[used],
+                                              weights=self.appended_frequency[used]))
+        self.needs_rebuild = self.idf_drift > self.idf_drift_threshold
+
+
+############################################
+# 3. Low-rank Embeddings
+############################################
+
+# Sparse TF-IDF rows have tens of thousands of columns. TruncatedSVD (randomized) projects them to 64-256 dense
+# dimensions; cosine similarity of the L2 normalized embeddings is a BLAS matrix product on contiguous float32 arrays.
+# The embeddings approximate the TF-IDF similarities: compare_embeddings reports memory, query latency and the
+# overlap of the top-10 lists with the sparse TF-IDF top-10, so the dimension can be chosen.
+
+def svd_embeddings(tfidf_matrix, n_components=128, seed=42):
+    '''
+    parameters:
+        tfidf_matrix: sparse TF-IDF matrix.
+        n_components: embedding dimension.
+        seed: random seed of the randomized SVD.
+    returns:
+        embeddings: C-contiguous float32 array (number of movies, n_components) with L2 normalized rows.
+        svd: fitted TruncatedSVD. svd.transform(tfidf rows) embeds new overviews (normalize the result).
+    '''
+    svd = TruncatedSVD(n_components=n_components, algorithm="randomized", random_state=seed)
+    embeddings = svd.fit_transform(sparse.csr_matrix(tfidf_matrix, dtype=np.float32))
+    return np.ascontiguousarray(normalize(embeddings), dtype=np.float32), svd
+
+
+def _query_latency(recommender, rows, k):
+    start = time.perf_counter()
+    for row in rows:
+        recommender._top_rows(int(row), k)
+    return (time.perf_counter() - start) / len(rows)
+
+
+def compare_embeddings(tfidf_matrix, dimensions=(64, 128, 256), n_queries=200, k=10, seed=42):
+    '''
+    parameters:
+        tfidf_matrix: sparse TF-IDF matrix.
+        dimensions: embedding dimensions to compare.
+        n_queries: number of random movies used for latency and overlap.
+        k: number of neighbors.
+        seed: random seed.
+    returns:
+        dataframe -- mode, memory_mb (similarity source), fit_seconds, query_ms (one movie), top_k_overlap
+        (mean share of the sparse TF-IDF top-k that the mode also returns).
+    '''
+    titles = pd.DataFrame({"title": np.arange(tfidf_matrix.shape[0])})
+    rows = np.random.default_rng(seed).choice(tfidf_matrix.shape[0], size=min(n_queries, tfidf_matrix.shape[0]),
+                                              replace=False)
+    sparse_recommender = ContentRecommender(titles, tfidf_matrix=tfidf_matrix)
+    matrix = sparse_recommender.matrix
+    exact = [sparse_recommender._top_rows(int(row), k) for row in rows]
+    results = [{"mode": "sparse", "memory_mb": (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20,
+                "fit_seconds": 0.0, "query_ms": _query_latency(sparse_recommender, rows, k) * 1000,
+                "top_k_overlap": 1.0}]
+
+    for n_components in dimensions:
+        start = time.perf_counter()
+        embeddings, _ = svd_embeddings(matrix, n_components, seed)
+        fit_seconds = time.perf_counter() - start
+        recommender = ContentRecommender(titles, embeddings=embeddings)
+        found = [recommender._top_rows(int(row), k) for row in rows]
+        overlap = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, exact)])
+        results.append({"mode": f"svd_{n_components}", "memory_mb": embeddings.nbytes / 2 ** 20,
+                        "fit_seconds": fit_seconds, "query_ms": _query_latency(recommender, rows, k) * 1000,
+                        "top_k_overlap": overlap})
+    return pd.DataFrame(results)
@@ -0,0 +1,91 @@
+############################################
+# FILE CACHE (Shared Helpers of the Data Caches)
+############################################
+
+# retail_data.py and movielens_data.py convert slow source files (excel, csv) once into array files under
+# CACHE_DIR. The cache directory of a source file is named after the file and a hash of its absolute path,
+# so files with the same name in different directories do not overwrite each other's cache.
+# meta.json of a cache keeps the absolute source path, modification time, size and content hash of the file.
+# cache_is_valid compares them; the content hash is computed only when the modification time changed.
+# meta.json is written to a temporary file and swapped in with os.replace, so readers never see a partial file.
+
+# 1. Cache Paths
+# 2. Cache Validation
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+
+CACHE_DIR = "datasets/cache"
+
+
+############################################
+# 1. Cache Paths
+############################################
+
+def file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def source_cache_path(path, cache_dir=CACHE_DIR, prefix="", suffix=""):
+    '''
+    returns:
+        cache directory of a source file: cache_dir/<prefix><file name><suffix>_<hash of the absolute path>.
+    '''
+    name = re.sub(r"[^0-9A-Za-z_-]+", "_", prefix + os.path.splitext(os.path.basename(path))[0] + suffix)
+    path_hash = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:10]
+    return os.path.join(cache_dir, name + "_" + path_hash)
+
+
+############################################
+# 2. Cache Validation
+############################################
+
+def source_meta(path):
+    '''
+    returns:
+        dictionary of the source file fields of meta.json (source, mtime_ns, size, sha1).
+    '''
+    stat = os.stat(path)
+    return {"source": os.path.abspath(path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            "sha1": file_hash(path)}
+
+
+def write_meta(cache_path, meta):
+    '''
+    Write meta.json of a cache atomically: the new file replaces the old one in one step.
+    '''
+    descriptor, temp_path = tempfile.mkstemp(dir=cache_path, prefix="meta_", suffix=".tmp")
+    with os.fdopen(descriptor, "w") as file:
+        json.dump(meta, file)
+    os.replace(temp_path, os.path.join(cache_path, "meta.json"))
+
+
+def cache_is_valid(path, cache_path):
+    '''
+    returns:
+        True if meta.json in cache_path was written for this source file and its content did not change.
+    '''
+    meta_path = os.path.join(cache_path, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as file:
+        meta = json.load(file)
+    if meta.get("source") != os.path.abspath(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_mtime_ns == meta["mtime_ns"] and stat.st_size == meta["size"]:
+        return True
+    # the file was touched. it is still valid if the content did not change.
+    if stat.st_size == meta["size"] and file_hash(path) == meta["sha1"]:
+        meta["mtime_ns"] = stat.st_mtime_ns
+        write_meta(cache_path, meta)
+        return True
+    return False
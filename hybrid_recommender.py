@@ -11,21 +11,19 @@
 #############################################
 
 import pandas as pd
+from interaction_matrix import create_interaction_matrix, to_frame
+from movielens_data import load_movies, load_ratings
 pd.pandas.set_option('display.max_columns', None)
 pd.pandas.set_option('display.width', 300)
 
 def create_user_movie_df():
     import pandas as pd
-    movie = pd.read_csv('datasets/movie.csv')
-    rating = pd.read_csv('datasets/ratings.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    # number of ratings for each movie
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 100].index
-    # common movies that are rated more than 150 times
-    common_movies = df[~df["title"].isin(rare_movies)]
-    # create pivot table
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
+    movie = load_movies('datasets/movie.csv')
+    rating = load_ratings('datasets/ratings.csv')
+    # sparse user-movie ratings of common movies that are rated more than 100 times
+    interactions = create_interaction_matrix(rating, rare_count=100)
+    # user-movie dataframe -- index: userId, columns: movie titles
+    user_movie_df = to_frame(interactions, movie)
     return user_movie_df
 
 
@@ -66,7 +64,7 @@ def user_based_recommender(random_user, user_movie_df, ratio=60, cor_th=0.65, sc
     top_users.rename(columns={"user_id_2": "userId"}, inplace=True)
 
     # add rating information to top_users: top_users_rating.
-    rating = pd.read_csv('datasets/ratings.csv')
+    rating = load_ratings('datasets/ratings.csv')
     top_users_ratings = top_users.merge(rating[["userId", "movieId", "rating"]], how='inner')
 
     # calculate weighted_rating= corr * rating
@@ -79,7 +77,7 @@ def user_based_recommender(random_user, user_movie_df, ratio=60, cor_th=0.65, sc
     # return movieId, weighted_rating and title information for movies with mean weighted_rating greater than 'score'
     movies_to_be_recommend = recommendation_df[recommendation_df["weighted_rating"] > score].sort_values(
         "weighted_rating", ascending=False)
-    movie = pd.read_csv('datasets/movie.csv')
+    movie = load_movies('datasets/movie.csv')
     return movies_to_be_recommend.merge(movie[["movieId", "title"]])
 
 
@@ -102,9 +100,9 @@ top5_movies_from_user_based=recommended_movies[:5]
 
 user = 512
 
-## 2.1: read movie and rating csv files.
-movie = pd.read_csv('datasets/movie.csv')
-rating = pd.read_csv('datasets/ratings.csv')
+## 2.1: read movie and rating csv files. (timestamp is needed to find the last rated movie.)
+movie = load_movies('datasets/movie.csv')
+rating = load_ratings('datasets/ratings.csv', columns=("userId", "movieId", "rating", "timestamp"))
 
 rating[rating["userId"] == user]["rating"].max()
 # 4.5 is the highest rating.
@@ -0,0 +1,308 @@
+############################################
+# INCREMENTAL ASSOCIATION RULES
+############################################
+
+# create_rules mines all invoices from scratch. IncrementalRuleMiner keeps the basket counts of the
+# frequent itemsets and of their negative border (infrequent itemsets whose all subsets are frequent)
+# together with the number of transactions. When new invoices arrive:
+#   - only the new baskets are scanned to update the counts of the tracked itemsets,
+#   - frequent itemsets that fall below min_support move to the border,
+#   - the history is scanned only if a border itemset becomes frequent, and only for the new
+#     candidate itemsets that this creates (FUP / negative border maintenance).
+# So the cost of an update depends on the size of the new batch, not on the size of the history.
+# WindowedRuleMiner keeps only the last N partitions (e.g. months). The counts of the tracked itemsets are kept
+# per partition, so an expired partition is subtracted from the counts without scanning it again.
+
+# 1. Incremental Rule Miner
+# 2. Sliding Window Miner
+# 3. Persisting the State
+
+import pickle
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import association_rules
+from scipy import sparse
+
+from arl_mining import count_itemsets, eclat, item_bitsets
+from rule_index import RuleIndex
+
+
+############################################
+# 1. Incremental Rule Miner
+############################################
+
+class IncrementalRuleMiner:
+    '''
+    parameters:
+        min_support: minimum support of frequent itemsets.
+    '''
+
+    def __init__(self, min_support=0.01):
+        self.min_support = min_support
+        self.n_transactions = 0
+        # item vocabulary -- item_ids[code] is the label of item code.
+        self.item_ids = []
+        self.item_codes = {}
+        # basket counts -- itemset (tuple of sorted item codes): count
+        self.frequent = {}
+        self.border = {}
+        # baskets seen so far, one sparse matrix per batch. scanned only when the frequent itemsets gain new members.
+        self.history = []
+
+    def min_count(self):
+        return max(int(np.ceil(self.min_support * self.n_transactions - 1e-9)), 1)
+
+    def fit(self, basket_matrix, item_ids):
+        '''
+        Mine the first batch of baskets from scratch.
+        parameters:
+            basket_matrix: boolean scipy sparse matrix -- rows: baskets, columns: items (create_basket_matrix output).
+            item_ids: item labels of the matrix columns.
+        '''
+        self.__init__(self.min_support)
+        basket_matrix = self._encode(basket_matrix, item_ids)
+        self.history = [basket_matrix]
+        self.n_transactions = basket_matrix.shape[0]
+
+        frequent_itemsets = eclat(basket_matrix, min_support=self.min_support)
+        counts = np.rint(frequent_itemsets["support"].to_numpy() * self.n_transactions).astype(np.int64)
+        self.frequent = {tuple(sorted(items)): int(count)
+                         for items, count in zip(frequent_itemsets["itemsets"], counts)}
+        # every item is a candidate. the border starts with the infrequent items and grows from the frequent itemsets.
+        self._add_candidates(list(self.frequent) + [(code,) for code in range(len(self.item_ids))])
+        return self
+
+    def update(self, basket_matrix, item_ids):
+        '''
+        Add a batch of new baskets and update itemset counts.
+        parameters: same as fit.
+        '''
+        n_items = len(self.item_ids)
+        delta = self._encode(basket_matrix, item_ids)
+        self.history.append(delta)
+        self.n_transactions += delta.shape[0]
+        self._add_new_items(n_items)
+        self._count_batch(delta)
+        self._reclassify()
+        return self
+
+    def _add_new_items(self, n_items):
+        # new items are not in the history. they start in the border with zero count.
+        for code in range(n_items, len(self.item_ids)):
+            self.border[(code,)] = 0
+
+    def _count_batch(self, delta, sign=1):
+        # add (sign=1) or subtract (sign=-1) the counts of the tracked itemsets in the baskets of delta.
+        delta_bitsets = item_bitsets(self._resize(delta))
+        batch_counts = {}
+        for counts in (self.frequent, self.border):
+            itemsets = list(counts)
+            for items, count in zip(itemsets, count_itemsets(delta_bitsets, itemsets)):
+                counts[items] += sign * int(count)
+                batch_counts[items] = int(count)
+        return batch_counts
+
+    def _reclassify(self):
+        min_count = self.min_count()
+        # frequent itemsets below the threshold move to the border.
+        for items in [items for items, count in self.frequent.items() if count < min_count]:
+            self.border[items] = self.frequent.pop(items)
+        # border itemsets above the threshold become frequent.
+        new_frequent = [items for items, count in self.border.items() if count >= min_count]
+        for items in new_frequent:
+            self.frequent[items] = self.border.pop(items)
+        # border itemsets must have only frequent subsets.
+        self.border = {items: count for items, count in self.border.items() if self._subsets_frequent(items)}
+
+        if new_frequent:
+            self._add_candidates(new_frequent)
+
+    def _add_candidates(self, itemsets):
+        # candidates: itemsets + one frequent item whose all subsets are frequent and that are not tracked yet.
+        # their counts are taken from the history. frequent candidates create new candidates again.
+        min_count = self.min_count()
+        while itemsets:
+            frequent_items = sorted(items[0] for items in self.frequent if len(items) == 1)
+            candidates = set()
+            for items in itemsets:
+                if len(items) == 1 and items not in self.frequent and items not in self.border:
+                    candidates.add(items)
+                if items not in self.frequent:
+                    continue
+                for item in frequent_items:
+                    if item in items:
+                        continue
+                    candidate = tuple(sorted(items + (item,)))
+                    if candidate not in self.frequent and candidate not in self.border \
+                            and self._subsets_frequent(candidate):
+                        candidates.add(candidate)
+            candidates = list(candidates)
+            counts = self._count_history(candidates)
+
+            itemsets = []
+            for items, count in zip(candidates, counts):
+                if count >= min_count:
+                    self.frequent[items] = int(count)
+                    itemsets.append(items)
+                else:
+                    self.border[items] = int(count)
+
+    def _count_history(self, itemsets):
+        # counts of itemsets in all baskets seen so far.
+        counts = np.zeros(len(itemsets), dtype=np.int64)
+        if itemsets:
+            for basket_matrix in self.history:
+                counts += count_itemsets(item_bitsets(self._resize(basket_matrix)), itemsets)
+        return counts
+
+    def _subsets_frequent(self, items):
+        if len(items) == 1:
+            return True
+        return all(subset in self.frequent for subset in combinations(items, len(items) - 1))
+
+    def _encode(self, basket_matrix, item_ids):
+        # map matrix columns to the item vocabulary. new items are added to the vocabulary.
+        codes = np.array([self.item_codes.setdefault(item, len(self.item_codes)) for item in item_ids],
+                         dtype=np.int64)
+        self.item_ids = list(self.item_codes)
+        basket_matrix = sparse.coo_matrix(basket_matrix)
+        return sparse.csr_matrix((basket_matrix.data.astype(bool), (basket_matrix.row, codes[basket_matrix.col])),
+                                 shape=(basket_matrix.shape[0], len(self.item_ids)))
+
+    def _resize(self, matrix):
+        # add empty columns for items that were added to the vocabulary after matrix was encoded.
+        return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr),
+                                 shape=(matrix.shape[0], len(self.item_ids)))
+
+    def frequent_itemsets(self):
+        '''
+        returns:
+            frequent itemsets in the same format as mlxtend apriori(use_colnames=True).
+        '''
+        labels = np.asarray(self.item_ids, dtype=object)
+        itemsets = sorted(self.frequent, key=lambda items: (len(items), items))
+        return pd.DataFrame({"support": np.array([self.frequent[items] for items in itemsets], dtype=np.float64)
+                                        / max(self.n_transactions, 1),
+                             "itemsets": [frozenset(labels[list(items)]) for items in itemsets]})
+
+    def rules(self, metric="support", min_threshold=0.01):
+        '''
+        returns:
+            association rules dataframe generated from the current frequent itemsets (same as create_rules).
+        '''
+        return association_rules(self.frequent_itemsets(), metric=metric, min_threshold=min_threshold)
+
+
+############################################
+# 2. Sliding Window Miner
+############################################
+
+class WindowedRuleMiner(IncrementalRuleMiner):
+    '''
+    parameters:
+        min_support: minimum support of frequent itemsets in the baskets of the window.
+        window: number of consecutive partition keys in the window (e.g. 6 months when the keys are month indices).
+    '''
+
+    def __init__(self, min_support=0.01, window=6):
+        super().__init__(min_support)
+        self.window = window
+        # partitions of the window in key order. history[p] is the basket matrix of keys[p] and
+        # partition_counts[p] has the counts of the tracked itemsets in it (itemset: count).
+        self.keys = []
+        self.partition_counts = []
+
+    def fit(self, partitions):
+        '''
+        Mine the window from scratch.
+        parameters:
+            partitions: iterable of (key, basket_matrix, item_ids) -- key: integer partition key (e.g. month index).
+        '''
+        self.__init__(self.min_support, self.window)
+        for key, basket_matrix, item_ids in partitions:
+            self.update_partition(key, basket_matrix, item_ids)
+        return self
+
+    def update(self, basket_matrix, item_ids):
+        raise TypeError("WindowedRuleMiner is updated by partition key. Use update_partition.")
+
+    def update_partition(self, key, basket_matrix, item_ids):
+        '''
+        Add the baskets of a partition (or replace them if the partition is already in the window),
+        then slide the window so that it ends at the newest key.
+        parameters:
+            key: integer partition key (e.g. month index). The baskets of the current month can be replaced
+                 every day with the same key.
+            basket_matrix, item_ids: same as IncrementalRuleMiner.fit.
+        '''
+        if self.keys and key <= self.keys[-1] - self.window:
+            # the partition is older than the window.
+            return self
+        n_items = len(self.item_ids)
+        delta = self._encode(basket_matrix, item_ids)
+        self._add_new_items(n_items)
+
+        # the old baskets of a replaced partition are subtracted with their stored counts.
+        if key in self.keys:
+            self._remove_partition(self.keys.index(key))
+        position = int(np.searchsorted(self.keys, key))
+        self.keys.insert(position, key)
+        self.history.insert(position, delta)
+        self.n_transactions += delta.shape[0]
+        self.partition_counts.insert(position, self._count_batch(delta))
+
+        # expired partitions are subtracted without scanning them.
+        while self.keys[0] <= self.keys[-1] - self.window:
+            self._remove_partition(0)
+
+        self._reclassify()
+        # drop the partition counts of the itemsets that are not tracked anymore.
+        for partition_counts in self.partition_counts:
+            for items in [items for items in partition_counts if items not in self.frequent and items not in self.border]:
+                del partition_counts[items]
+        return self
+
+    def _remove_partition(self, position):
+        partition_counts = self.partition_counts.pop(position)
+        self.n_transactions -= self.history.pop(position).shape[0]
+        self.keys.pop(position)
+        for counts in (self.frequent, self.border):
+            for items in counts:
+                counts[items] -= partition_counts.get(items, 0)
+
+    def _count_history(self, itemsets):
+        # counts of itemsets in the partitions of the window. partition counts are stored for later subtraction.
+        counts = np.zeros(len(itemsets), dtype=np.int64)
+        if itemsets:
+            for basket_matrix, partition_counts in zip(self.history, self.partition_counts):
+                batch_counts = count_itemsets(item_bitsets(self._resize(basket_matrix)), itemsets)
+                partition_counts.update(zip(itemsets, batch_counts.tolist()))
+                counts += batch_counts
+        return counts
+
+    def rule_index(self, metric="support", min_threshold=0.01):
+        '''
+        returns:
+            RuleIndex of the rules of the current window. It can be swapped in for the previous index
+            by the serving code (or written with rule_index.save_rules).
+        '''
+        return RuleIndex(self.rules(metric=metric, min_threshold=min_threshold))
+
+
+############################################
+# 3. Persisting the State
+############################################
+
+def save_miner(miner, path):
+    with open(path, "wb") as file:
+        pickle.dump(miner.__dict__, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_miner(path):
+    with open(path, "rb") as file:
+        state = pickle.load(file)
+    miner = WindowedRuleMiner() if "window" in state else IncrementalRuleMiner()
+    miner.__dict__.update(state)
+    return miner
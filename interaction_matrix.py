@@ -0,0 +1,153 @@
+############################################
+# INTERACTION MATRIX (Sparse User x Movie Ratings)
+############################################
+
+# The collaborative filtering scripts repeat the same create_user_movie_df: left join of all movies onto the
+# ratings, value_counts of titles to find rare movies and pivot_table into a dense float64 dataframe keyed by titles.
+# On rating.csv (20M ratings) the merge and the pivot need tens of GB.
+# create_interaction_matrix works on the rating columns only:
+#   - userId and movieId are encoded to int32 codes (pd.factorize),
+#   - rating counts of movies are np.bincount of the movie codes; rare movies are dropped with a boolean mask,
+#   - the ratings are stored in a float32 csr matrix -- rows: users, columns: movies. Missing ratings are not stored.
+# Columns are keyed by movieId, so movies with the same title (e.g. remakes) stay separate movies.
+# to_frame returns the dense pandas view (user_movie_df) for the pandas based steps of the scripts.
+
+# 1. Interaction Matrix
+# 2. User-Movie Dataframe
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+############################################
+# 1. Interaction Matrix
+############################################
+
+class InteractionMatrix:
+    '''
+    parameters:
+        matrix: float32 csr matrix -- rows: users, columns: movies.
+        user_ids: userId of every row (sorted).
+        movie_ids: movieId of every column (sorted).
+    '''
+
+    def __init__(self, matrix, user_ids, movie_ids):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def _codes(self, ids, values):
+        # ids are sorted: codes are found with binary search. unknown ids raise KeyError.
+        values = np.asarray(values)
+        codes = np.searchsorted(ids, values)
+        codes = np.minimum(codes, len(ids) - 1)
+        if not np.array_equal(ids[codes], values):
+            raise KeyError(f"unknown ids: {np.setdiff1d(values, ids).tolist()[:10]}")
+        return codes
+
+    def user_codes(self, user_ids):
+        return self._codes(self.user_ids, user_ids)
+
+    def movie_codes(self, movie_ids):
+        return self._codes(self.movie_ids, movie_ids)
+
+    def user_ratings(self, user_id):
+        '''
+        returns:
+            pandas series of the ratings of a user -- index: movieId.
+        '''
+        row = self.matrix[self.user_codes([user_id])[0]]
+        return pd.Series(row.data, index=self.movie_ids[row.indices], name="rating")
+
+    def rating_counts(self):
+        '''
+        returns:
+            number of ratings of every movie (column).
+        '''
+        return np.bincount(self.matrix.indices, minlength=self.matrix.shape[1])
+
+    def movie_labels(self, movies):
+        '''
+        parameters:
+            movies: movie dataframe with movieId and title columns (movie.csv).
+        returns:
+            pandas series -- index: movieId of the columns, values: titles. Titles that belong to more than one
+            movie get the movieId in brackets ("title [movieId]") so that the labels are unique.
+        '''
+        # titles may be categoricals (load_movies). labels are built as strings.
+        titles = movies.drop_duplicates("movieId").set_index("movieId")["title"].astype(object)
+        titles = titles.reindex(self.movie_ids)
+        labels = titles.fillna(pd.Series(self.movie_ids, index=self.movie_ids).astype(str))
+        duplicated = labels.duplicated(keep=False)
+        labels[duplicated] = labels[duplicated] + " [" + labels.index[duplicated].astype(str) + "]"
+        return labels
+
+
+def create_interaction_matrix(ratings, rare_count=0, user_col="userId", item_col="movieId", rating_col="rating"):
+    '''
+    parameters:
+        ratings: rating dataframe (rating.csv / ratings_small.csv).
+        rare_count: movies with rare_count or fewer ratings are dropped (same as rare_movies of the scripts).
+        user_col, item_col, rating_col: column names.
+    returns:
+        InteractionMatrix. Users without ratings of the remaining movies are not included.
+        Duplicate (user, movie) ratings are averaged as in pivot_table.
+    '''
+    movie_codes, movie_ids = pd.factorize(ratings[item_col].to_numpy(), sort=True)
+    movie_codes = movie_codes.astype(np.int32)
+
+    # rare movies: rating counts from the codes instead of value_counts of the merged dataframe.
+    counts = np.bincount(movie_codes, minlength=len(movie_ids))
+    common = counts > rare_count
+    keep = common[movie_codes]
+    # new codes of the common movies: 0 .. number of common movies - 1.
+    new_codes = np.cumsum(common, dtype=np.int32) - 1
+    movie_codes = new_codes[movie_codes[keep]]
+    movie_ids = np.asarray(movie_ids)[common]
+
+    user_codes, user_ids = pd.factorize(ratings[user_col].to_numpy()[keep], sort=True)
+    values = ratings[rating_col].to_numpy(dtype=np.float32)[keep]
+    shape = (len(user_ids), len(movie_ids))
+    matrix = sparse.csr_matrix((values, (user_codes.astype(np.int32), movie_codes)), shape=shape)
+    matrix.sum_duplicates()
+    if matrix.nnz < len(values):
+        # some (user, movie) pairs have more than one rating: divide the sums by the number of ratings.
+        n_ratings = sparse.csr_matrix((np.ones(len(values), dtype=np.float32),
+                                       (user_codes.astype(np.int32), movie_codes)), shape=shape)
+        n_ratings.sum_duplicates()
+        matrix.data /= n_ratings.data
+    return InteractionMatrix(matrix, np.asarray(user_ids), movie_ids)
+
+
+############################################
+# 2. User-Movie Dataframe
+############################################
+
+def to_frame(interactions, movies=None, users=None, movie_ids=None):
+    '''
+    parameters:
+        interactions: InteractionMatrix.
+        movies: movie dataframe. If given, columns are movie titles (movie_labels), otherwise movieIds.
+        users, movie_ids: userIds / movieIds to include. None includes all of them.
+    returns:
+        dense float32 user_movie_df -- index: userId, columns: movies, NaN: not rated.
+    '''
+    matrix = interactions.matrix
+    user_ids, column_ids = interactions.user_ids, interactions.movie_ids
+    if users is not None:
+        matrix, user_ids = matrix[interactions.user_codes(users)], np.asarray(users)
+    if movie_ids is not None:
+        matrix, column_ids = matrix[:, interactions.movie_codes(movie_ids)], np.asarray(movie_ids)
+
+    # NaN for the missing ratings: fill the dense array with NaN and write the stored ratings.
+    matrix = sparse.coo_matrix(matrix)
+    values = np.full(matrix.shape, np.nan, dtype=np.float32)
+    values[matrix.row, matrix.col] = matrix.data
+    columns = column_ids if movies is None else interactions.movie_labels(movies)[column_ids].to_numpy()
+    return pd.DataFrame(values, index=pd.Index(user_ids, name="userId"),
+                        columns=pd.Index(columns, name="movieId" if movies is None else "title"))
@@ -8,6 +8,7 @@
 # 2. Create User Movie Df
 # 3. Item-Based Movie Recommendations
 # 4. Script
+# 5. Precomputed Item Neighbors
 
 ### Business Problem : When users like a movie, recommend other movies with "similar liking patterns" to that movie.
 
@@ -18,10 +19,14 @@
 ######################################
 
 import pandas as pd
+from interaction_matrix import create_interaction_matrix, to_frame
+from item_similarity import ItemNeighbors, item_neighbors, load_item_neighbors, save_item_neighbors
+from movielens_data import load_movies, load_ratings
 pd.set_option('display.max_columns', 500)
 
-movie = pd.read_csv('datasets/movie.csv')
-rating = pd.read_csv('datasets/ratings_small.csv')
+# only the used columns are read (int32 ids, float32 ratings). the csv files are cached as .npy files on the first run.
+movie = load_movies(columns=("movieId", "title", "genres"))
+rating = load_ratings('datasets/ratings_small.csv')
 
 # merge movie and rating on common column of 'movieId'
 df = movie.merge(rating, how="left", on="movieId")
@@ -43,16 +48,14 @@ comment_counts = pd.DataFrame(df["title"].value_counts())
 comment_counts.describe()
 # mean rating count for a movie is maximum 341. (small dataset is used.)
 
-# determine rare movies having less than 50 ratings
-rare_movies = comment_counts[comment_counts["count"] <= 50].index
+# sparse user-movie rating matrix without rare movies (50 or fewer ratings).
+# rating counts are counted per movieId, so movies with the same title are not merged.
+interactions = create_interaction_matrix(rating, rare_count=50)
 
-# determine common movies as movies that are not in rare_movies
-common_movies = df[~df["title"].isin(rare_movies)]
+interactions.shape[1]   # 444 movies
 
-common_movies["title"].nunique()   # 444 movies
-
-# create pivot table --- index=userId, column= movie title, value=rating
-user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
+# dense user-movie dataframe --- index=userId, column= movie title, value=rating
+user_movie_df = to_frame(interactions, movie)
 
 user_movie_df.isnull().sum()
 # there are missing rating values due to movies that are not rated by some users.
@@ -95,16 +98,12 @@ def check_film(keyword, user_movie_df):
 
 def create_user_movie_df():
     import pandas as pd
-    movie = pd.read_csv('datasets/movie.csv')
-    rating = pd.read_csv('datasets/rating.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    # number of ratings for each movie
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 50].index
+    movie = load_movies('datasets/movie.csv')
+    rating = load_ratings('datasets/rating.csv')
     # common movies that are rated more than 50 times
-    common_movies = df[~df["title"].isin(rare_movies)]
-    # create pivot table in order to calculate correlations.
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
+    interactions = create_interaction_matrix(rating, rare_count=50)
+    # user-movie dataframe in order to calculate correlations.
+    user_movie_df = to_frame(interactions, movie)
     return user_movie_df
 
 
@@ -130,6 +129,30 @@ item_based_recommender(movie_name, user_movie_df)
 
 
 
+######################################
+# 5. Precomputed Item Neighbors
+######################################
 
-
-
+# item_based_recommender computes corrwith over the whole pivot table for every query.
+# item_neighbors computes the pearson correlations of all movie pairs once from the sparse rating matrix
+# (only the given ratings are stored) and keeps the top 10 neighbors of every movie. Queries are array lookups.
+# interactions: sparse rating matrix of section 2 (ratings_small.csv, movies with more than 50 ratings).
+titles = interactions.movie_labels(movie)
+
+# pearson: same correlations as corrwith. min_common: minimum number of users who rated both movies.
+neighbors, scores, counts = item_neighbors(interactions.matrix, k=10, method="pearson", min_common=2)
+movie_neighbors = ItemNeighbors(interactions.movie_ids, neighbors, scores, counts)
+
+# movieId 2571: "Matrix, The (1999)"
+titles[movie_neighbors.recommend(2571)]
+# (movieId, correlation, number of common users)
+movie_neighbors.similar_items(2571, k=5)
+
+# adjusted cosine: ratings are centered by user means instead of movie means.
+neighbors, scores, counts = item_neighbors(interactions.matrix, k=10, method="adjusted_cosine", min_common=5)
+titles[ItemNeighbors(interactions.movie_ids, neighbors, scores, counts).recommend(2571)]
+
+# save once, load (memory-mapped) in the serving process.
+save_item_neighbors(movie_neighbors, "datasets/cache/item_neighbors")
+movie_neighbors = load_item_neighbors("datasets/cache/item_neighbors")
+titles[movie_neighbors.recommend(int(interactions.movie_ids[0]))]
@@ -0,0 +1,174 @@
+############################################
+# ITEM-ITEM SIMILARITIES (Sparse Pearson / Adjusted Cosine)
+############################################
+
+# item_based_recommender calls user_movie_df.corrwith(movie_ratings) on the dense user-movie pivot table for
+# every query. item_neighbors computes the similarities of all movie pairs once from a sparse user x movie
+# rating matrix and keeps the top-k neighbors of every movie. A query is then an array lookup.
+#
+# Pearson correlation of movies i and j over the users who rated both (same as corrwith, pairwise complete):
+#   n = number of common users, Sx / Sy = sums of the ratings of i / j, Sxx / Syy = sums of squares, Sxy = sum of products
+#   corr = (n Sxy - Sx Sy) / sqrt((n Sxx - Sx^2) (n Syy - Sy^2))
+# With R: ratings (users x movies, sparse) and B: rated (0/1) all of these sums are sparse matrix products, e.g.
+# n = B.T @ B, Sx = R.T @ B, Sxy = R.T @ R. Ratings are centered by movie means first (correlation does not change,
+# but the sums are smaller and more precise).
+# Adjusted cosine centers the ratings by user means and takes the cosine over the common users.
+# Movie pairs with fewer than min_common common users are not used.
+
+# 1. Item-Item Similarities
+# 2. Stored Neighbors
+
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from content_similarity import top_k_rows
+
+
+############################################
+# 1. Item-Item Similarities
+############################################
+
+def center_ratings(ratings_matrix, axis=0):
+    '''
+    parameters:
+        ratings_matrix: sparse rating matrix -- rows: users, columns: movies. missing ratings are not stored.
+        axis: 0 subtracts movie (column) means, 1 subtracts user (row) means.
+    returns:
+        float64 csr matrix of centered ratings with the same sparsity pattern.
+    '''
+    matrix = sparse.csr_matrix(ratings_matrix, dtype=np.float64, copy=True)
+    matrix.sort_indices()
+    if axis == 0:
+        groups, n_groups = matrix.indices, matrix.shape[1]
+    else:
+        groups, n_groups = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr)), matrix.shape[0]
+    counts = np.bincount(groups, minlength=n_groups)
+    means = np.bincount(groups, weights=matrix.data, minlength=n_groups) / np.maximum(counts, 1)
+    matrix.data -= means[groups]
+    return matrix
+
+
+def item_similarity_blocks(ratings_matrix, method="pearson", min_common=2, block_size=1000):
+    '''
+    parameters:
+        ratings_matrix: sparse rating matrix -- rows: users, columns: movies.
+        method: "pearson" or "adjusted_cosine".
+        min_common: minimum number of users who rated both movies.
+        block_size: number of movies whose similarities are computed at once.
+    returns:
+        generator of (columns, similarities, counts) -- similarities/counts of the movies in columns (rows of the
+        block) with all movies. similarities are nan for pairs without enough common users or without variance.
+    '''
+    rated = sparse.csc_matrix(ratings_matrix, dtype=np.float64, copy=True)
+    rated.data[:] = 1.0
+    if method == "pearson":
+        values = sparse.csc_matrix(center_ratings(ratings_matrix, axis=0))
+    elif method == "adjusted_cosine":
+        values = sparse.csc_matrix(center_ratings(ratings_matrix, axis=1))
+    else:
+        raise ValueError(f"unknown similarity method: {method}")
+    squares = values.multiply(values).tocsc()
+
+    n_items = rated.shape[1]
+    for start in range(0, n_items, block_size):
+        columns = np.arange(start, min(start + block_size, n_items))
+        block_rated, block_values, block_squares = rated[:, columns], values[:, columns], squares[:, columns]
+        # sums over the users who rated both movies. rows: block movies, columns: all movies.
+        counts = (block_rated.T @ rated).toarray()
+        products = (block_values.T @ values).toarray()
+        sum_squares_x = (block_squares.T @ rated).toarray()
+        sum_squares_y = (block_rated.T @ squares).toarray()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if method == "pearson":
+                sum_x = (block_values.T @ rated).toarray()
+                sum_y = (block_rated.T @ values).toarray()
+                numerator = counts * products - sum_x * sum_y
+                variance_x = counts * sum_squares_x - sum_x ** 2
+                variance_y = counts * sum_squares_y - sum_y ** 2
+            else:
+                numerator, variance_x, variance_y = products, sum_squares_x, sum_squares_y
+            denominator = np.sqrt(variance_x * variance_y)
+            similarities = np.where((denominator > 1e-12) & (counts >= min_common), numerator / denominator, np.nan)
+        yield columns, np.clip(similarities, -1, 1), counts.astype(np.int32)
+
+
+def item_neighbors(ratings_matrix, k=10, method="pearson", min_common=2, block_size=1000):
+    '''
+    parameters: same as item_similarity_blocks. k: number of neighbors per movie.
+    returns:
+        neighbors: int32 (number of movies, k) column indices of the most similar movies, most similar first (-1: none).
+        scores: float32 similarities (-inf: none).
+        counts: int32 numbers of common users.
+    '''
+    n_items = ratings_matrix.shape[1]
+    k = min(k, n_items - 1)
+    neighbors = np.empty((n_items, k), dtype=np.int32)
+    scores = np.empty((n_items, k), dtype=np.float32)
+    counts = np.empty((n_items, k), dtype=np.int32)
+    for columns, similarities, common in item_similarity_blocks(ratings_matrix, method, min_common, block_size):
+        similarities = np.where(np.isnan(similarities), -np.inf, similarities)
+        # the movie itself is not a neighbor.
+        similarities[np.arange(len(columns)), columns] = -np.inf
+        neighbors[columns], scores[columns] = top_k_rows(similarities, k)
+        counts[columns] = np.take_along_axis(common, neighbors[columns].astype(np.int64), axis=1)
+    neighbors[np.isneginf(scores)] = -1
+    return neighbors, scores, counts
+
+
+############################################
+# 2. Stored Neighbors
+############################################
+
+# save_item_neighbors writes the neighbor arrays as .npy files and the movie ids as json.
+# load_item_neighbors memory-maps them; recommend is a lookup in the neighbor array.
+
+class ItemNeighbors:
+    '''
+    parameters:
+        item_ids: movie ids (or titles) of the rating matrix columns.
+        neighbors, scores, counts: item_neighbors output.
+    '''
+
+    def __init__(self, item_ids, neighbors, scores, counts):
+        self.item_ids = list(item_ids)
+        self.item_codes = {item: code for code, item in enumerate(self.item_ids)}
+        self.neighbors = neighbors
+        self.scores = scores
+        self.counts = counts
+
+    def recommend(self, item_id, k=10):
+        '''
+        returns:
+            ids of the k most similar movies -- same as item_based_recommender.
+        '''
+        row = self.neighbors[self.item_codes[item_id], :k]
+        return [self.item_ids[code] for code in row if code >= 0]
+
+    def similar_items(self, item_id, k=10):
+        '''
+        returns:
+            list of (movie id, similarity, number of common users) of the k most similar movies.
+        '''
+        code = self.item_codes[item_id]
+        return [(self.item_ids[neighbor], float(score), int(count))
+                for neighbor, score, count in zip(self.neighbors[code, :k], self.scores[code, :k], self.counts[code, :k])
+                if neighbor >= 0]
+
+
+def save_item_neighbors(item_neighbors, path):
+    os.makedirs(path, exist_ok=True)
+    for name in ("neighbors", "scores", "counts"):
+        np.save(os.path.join(path, name + ".npy"), getattr(item_neighbors, name))
+    with open(os.path.join(path, "items.json"), "w") as file:
+        # numpy scalars are converted to Python ints/strings.
+        json.dump([item.item() if hasattr(item, "item") else item for item in item_neighbors.item_ids], file)
+
+
+def load_item_neighbors(path):
+    with open(os.path.join(path, "items.json")) as file:
+        item_ids = json.load(file)
+    arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in ("neighbors", "scores", "counts")]
+    return ItemNeighbors(item_ids, *arrays)
@@ -8,6 +8,9 @@ import pandas as pd
 from surprise import Reader, SVD, Dataset, accuracy
 from surprise.model_selection import GridSearchCV, train_test_split
 
+from interaction_matrix import create_interaction_matrix, to_frame
+from movielens_data import load_movies, load_ratings
+
 pd.set_option('display.max_columns', None)
 
 # 1. Prepare the Dataset
@@ -23,8 +26,8 @@ pd.set_option('display.max_columns', None)
 #############################
 
 # read csv files and merge.
-movie = pd.read_csv('datasets/movie.csv')
-rating = pd.read_csv('datasets/ratings_small.csv')
+movie = load_movies(columns=("movieId", "title", "genres"))
+rating = load_ratings('datasets/ratings_small.csv')
 df = movie.merge(rating, how="left", on="movieId")
 df.head()
 
@@ -39,10 +42,9 @@ movies = ["Toy Story (1995)",
 sample_df = df[df.movieId.isin(movie_ids)]
 sample_df.head()
 
-# we only need userId, title and rating information from sample_df. Show them as pivot table.
-user_movie_df = sample_df.pivot_table(index=["userId"],
-                                      columns=["title"],
-                                      values="rating")
+# we only need userId, title and rating information from sample_df. Show them as user-movie dataframe.
+sample_interactions = create_interaction_matrix(rating[rating.movieId.isin(movie_ids)])
+user_movie_df = to_frame(sample_interactions, movie)
 
 user_movie_df.shape    # (452, 4) - 452 users, 4 movies
 
@@ -0,0 +1,183 @@
+############################################
+# MOVIELENS DATA (Typed Loading and Binary Cache)
+############################################
+
+# The collaborative filtering scripts read rating.csv with pd.read_csv defaults: every column is parsed
+# (also timestamp, which is not used) into int64/float64 columns, and user_based_recommender reads the file
+# again on every call.
+# read_ratings / read_movies read only the needed columns with small dtypes (userId, movieId: int32,
+# rating: float32), optionally in chunks.
+# load_ratings / load_movies convert the csv once into a columnar cache (one .npy file per column) and
+# memory-map the arrays in the next calls, so reading rating.csv takes milliseconds instead of seconds.
+# Text columns (title, genres) are stored as int32 codes + a category list (categories_<column>.json) as in
+# retail_data.py and are loaded as pandas categoricals.
+# The cache directory is keyed by the file name and its absolute path (file_cache.py). The cache is rebuilt when
+# the csv file changes (modification time and size, then content hash) or when a column that is not in the cache
+# is requested.
+# A rebuild never writes over the arrays of the previous cache, which may still be mapped by other dataframes or
+# processes (rewriting a mapped file crashes them with SIGBUS). The arrays are written to a new data directory and
+# meta.json, which names the current data directory, is swapped in with os.replace. Old data directories are
+# removed afterwards; on POSIX the removed files stay readable through the existing mappings.
+
+# 1. Typed Reading
+# 2. Building the Cache
+# 3. Loading the Cache
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from file_cache import CACHE_DIR, cache_is_valid, source_cache_path, source_meta, write_meta
+
+
+RATINGS_PATH = "datasets/rating.csv"
+MOVIES_PATH = "datasets/movie.csv"
+
+RATING_COLUMNS = ("userId", "movieId", "rating")
+MOVIE_COLUMNS = ("movieId", "title")
+
+# dtypes of the movielens columns. timestamp is kept as seconds (int64) instead of parsing dates.
+COLUMN_DTYPES = {"userId": np.int32, "movieId": np.int32, "rating": np.float32, "timestamp": np.int64,
+                 "title": str, "genres": str}
+
+# layout version of the cache. caches written with another layout are rebuilt.
+CACHE_VERSION = 2
+
+
+############################################
+# 1. Typed Reading
+############################################
+
+def read_columns(path, columns, chunksize=None):
+    '''
+    parameters:
+        path: csv file.
+        columns: columns to read. Other columns are skipped by the csv parser.
+        chunksize: number of rows per chunk. If None, the whole file is read.
+    returns:
+        dataframe with the COLUMN_DTYPES dtypes, or a generator of dataframe chunks if chunksize is given.
+    '''
+    columns = list(columns)
+    dtypes = {column: COLUMN_DTYPES[column] for column in columns if column in COLUMN_DTYPES}
+    return pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def read_ratings(path=RATINGS_PATH, columns=RATING_COLUMNS, chunksize=None):
+    return read_columns(path, columns, chunksize)
+
+
+def read_movies(path=MOVIES_PATH, columns=MOVIE_COLUMNS, chunksize=None):
+    return read_columns(path, columns, chunksize)
+
+
+############################################
+# 2. Building the Cache
+############################################
+
+def build_csv_cache(path, columns, cache_dir=CACHE_DIR, chunksize=1000000):
+    '''
+    Read the csv file once in chunks and write every column as a .npy file into a new data directory.
+    text columns are stored as int32 codes and a json list of categories.
+    returns:
+        cache directory.
+    '''
+    cache_path = source_cache_path(path, cache_dir, prefix="csv_")
+    os.makedirs(cache_path, exist_ok=True)
+    columns = list(columns)
+
+    parts = {column: [] for column in columns}
+    # categories of the text columns: value -> code. the codes of a value are the same in all chunks.
+    categories = {}
+    for chunk in read_columns(path, columns, chunksize):
+        for column in columns:
+            values = chunk[column]
+            if COLUMN_DTYPES.get(column) is str or not pd.api.types.is_numeric_dtype(values):
+                codes = categories.setdefault(column, {})
+                chunk_codes, chunk_categories = pd.factorize(values.fillna(""))
+                # codes of the chunk categories in the whole file. new categories get the next codes.
+                mapping = np.array([codes.setdefault(category, len(codes)) for category in chunk_categories],
+                                   dtype=np.int32)
+                values = mapping[chunk_codes]
+            else:
+                values = values.to_numpy(dtype=COLUMN_DTYPES.get(column, values.dtype))
+            parts[column].append(values)
+    data_path = tempfile.mkdtemp(dir=cache_path, prefix="data_")
+    for column in columns:
+        np.save(os.path.join(data_path, column + ".npy"), np.concatenate(parts[column]))
+        if column in categories:
+            with open(os.path.join(data_path, "categories_%s.json" % column), "w") as file:
+                json.dump(list(categories[column]), file)
+
+    # the new arrays become visible at once, when meta.json is replaced.
+    write_meta(cache_path, dict(source_meta(path), version=CACHE_VERSION, columns=columns,
+                                data_dir=os.path.basename(data_path)))
+    for name in os.listdir(cache_path):
+        if name.startswith("data_") and name != os.path.basename(data_path):
+            # mapped files of other processes can not be removed on windows. they are removed by a later build.
+            shutil.rmtree(os.path.join(cache_path, name), ignore_errors=True)
+    return cache_path
+
+
+############################################
+# 3. Loading the Cache
+############################################
+
+def load_columns(path, columns, cache_dir=CACHE_DIR):
+    '''
+    parameters:
+        path: csv file.
+        columns: columns to load.
+        cache_dir: directory of the cache. The cache is created on the first call.
+    returns:
+        dictionary of memory-mapped arrays -- column name: values. The arrays are mapped copy-on-write
+        (mmap_mode="c"): modified pages are copied in memory, the cache files do not change.
+        Text columns are pandas categoricals over the mapped codes.
+    '''
+    cache_path = source_cache_path(path, cache_dir, prefix="csv_")
+    meta = {"columns": []}
+    if cache_is_valid(path, cache_path):
+        with open(os.path.join(cache_path, "meta.json")) as file:
+            meta = json.load(file)
+    if meta.get("version") != CACHE_VERSION or not set(columns) <= set(meta["columns"]):
+        # the new columns are added to the cached ones.
+        cached = meta["columns"] + [column for column in columns if column not in meta["columns"]]
+        build_csv_cache(path, cached, cache_dir)
+        with open(os.path.join(cache_path, "meta.json")) as file:
+            meta = json.load(file)
+    data_path = os.path.join(cache_path, meta["data_dir"])
+    arrays = {}
+    for column in columns:
+        values = np.load(os.path.join(data_path, column + ".npy"), mmap_mode="c")
+        categories_path = os.path.join(data_path, "categories_%s.json" % column)
+        if os.path.exists(categories_path):
+            with open(categories_path) as file:
+                categories = json.load(file)
+            values = pd.Categorical.from_codes(values, categories=pd.Index(categories, dtype=object))
+        arrays[column] = values
+    return arrays
+
+
+def _mapped_frame(arrays):
+    # columns are wrapped as series first: a dictionary of arrays would be copied into one block per dtype.
+    # the dataframe keeps the mapped arrays.
+    return pd.DataFrame({column: pd.Series(values, copy=False) for column, values in arrays.items()}, copy=False)
+
+
+def load_ratings(path=RATINGS_PATH, columns=RATING_COLUMNS, cache_dir=CACHE_DIR):
+    '''
+    returns:
+        rating dataframe with the given columns (int32 ids, float32 ratings) over the memory-mapped cache.
+    '''
+    return _mapped_frame(load_columns(path, columns, cache_dir))
+
+
+def load_movies(path=MOVIES_PATH, columns=MOVIE_COLUMNS, cache_dir=CACHE_DIR):
+    '''
+    returns:
+        movie dataframe with the given columns (title and genres as categoricals).
+    '''
+    return _mapped_frame(load_columns(path, columns, cache_dir))
@@ -22,6 +22,11 @@
 
 import pandas as pd
 from mlxtend.frequent_patterns import apriori, association_rules
+from arl_mining import create_segment_rules, eclat, son_frequent_itemsets, topk_association_rules
+from basket_matrix import create_basket_df, create_basket_matrix
+from incremental_rules import IncrementalRuleMiner
+from retail_data import ProductCatalog, load_retail_data, retail_data_prep
+from rule_index import RuleIndex, load_rules, save_rules
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
@@ -38,7 +43,9 @@ pd.set_option('display.expand_frame_repr', False)
 
 ## 1.1: Read sheet 'Year 2010-2011' from 'online_retail_II' excel file.
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx", sheet_name="Year 2010-2011")
+# the excel sheet is converted to a columnar cache on the first run. next runs read the cache in seconds.
+# load_retail_data(countries=["Germany"]) would read only the rows of Germany.
+df_ = load_retail_data("datasets/online_retail_II.xlsx", sheet_name="Year 2010-2011")
 df = df_.copy()
 
 df.head()
@@ -58,35 +65,10 @@ df.isnull().sum()
 ## 1.5: Filter observation units whose price value is less than zero.
 ## 1.6: Examine the outliers of the Price and Quantity variables and suppress them with threshold values if necessary.
 
-def outlier_thresholds(dataframe, variable):
-    quartile1 = dataframe[variable].quantile(0.01)
-    quartile3 = dataframe[variable].quantile(0.99)
-    interquantile_range = quartile3 - quartile1
-    up_limit = quartile3 + 1.5 * interquantile_range
-    low_limit = quartile1 - 1.5 * interquantile_range
-    return low_limit, up_limit
-
-def replace_with_thresholds(dataframe, variable):
-    low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
-
-
-# do steps with a function "retail_data_prep"
-
-def retail_data_prep(dataframe):
-    # drop missing values
-    dataframe.dropna(inplace=True)
-    # drop "Invoice" values containing 'C'
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    # Drop values of 'POST' in "StockCode" column.
-    dataframe = dataframe[~dataframe["StockCode"].str.contains("POST", na=False)]
-    dataframe = dataframe[dataframe["Quantity"] > 0]
-    dataframe = dataframe[dataframe["Price"] > 0]
-    # replace outliers with threshold values
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    return dataframe
+# do steps with a function "retail_data_prep" (retail_data.py).
+# All filters are combined in one boolean mask, so the rows are copied only once.
+# Cancelled invoices (Invoice starts with 'C') and POST rows are found with prefix tests instead of regex.
+# Outliers are replaced with the interquartile range thresholds using np.clip.
 
 df = retail_data_prep(df)
 
@@ -113,41 +95,44 @@ df.head()
 # id=True -- analysis will be done using StockCode instead of product descriptions.
 
 def create_invoice_product_df(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
+    item_col = "StockCode" if id else "Description"
+    # sparse 1/0 invoice-product dataframe built from integer codes in one pass.
+    return create_basket_df(dataframe, "Invoice", item_col, "Quantity").astype(pd.SparseDtype("int8", 0))
 
 def create_invoice_product_df_bool(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: True if x > 0 else False)
+    item_col = "StockCode" if id else "Description"
+    # sparse True/False invoice-product dataframe. apriori uses it without densifying.
+    return create_basket_df(dataframe, "Invoice", item_col, "Quantity")
 
 invoice_product_df = create_invoice_product_df_bool(df, id=True)
 
 
-def check_id(dataframe, stock_code):
-    product_name = dataframe[dataframe["StockCode"] == stock_code][["Description"]].values[0].tolist()
+# product catalog: the most frequent Description of each StockCode. built once, then each lookup is O(1).
+catalog = ProductCatalog(df)
+
+def check_id(catalog, stock_code):
+    product_name = catalog.name(stock_code)
     print(product_name)
+    return product_name
 
-check_id(df, 10120)
+check_id(catalog, 10120)
 
 ## 2.2 : Generate association rules by defining "create_rules" and then find rules for the customers from Germany.
 
 
-def create_rules(dataframe, id=True, country="Germany"):
+def create_rules(dataframe, id=True, country="Germany", algorithm="apriori", top_k=None):
     # create dataframe for specified country.
     dataframe = dataframe[dataframe['Country'] == country]
     # create invoice-product dataframe. 
     dataframe = create_invoice_product_df(dataframe, id)
-    # calculate support values.
-    frequent_itemsets = apriori(dataframe, min_support=0.01, use_colnames=True)
-    # generate associatian rules.
+    # calculate support values. algorithm="eclat" uses the bitset miner that is faster at low supports.
+    if algorithm == "eclat":
+        frequent_itemsets = eclat(dataframe, min_support=0.01, use_colnames=True)
+    else:
+        frequent_itemsets = apriori(dataframe, min_support=0.01, use_colnames=True)
+    # generate associatian rules. top_k keeps only the best top_k rules (by lift) of each antecedent.
+    if top_k is not None:
+        return topk_association_rules(frequent_itemsets, metric="lift", k=top_k)
     rules = association_rules(frequent_itemsets, metric="support", min_threshold=0.01)
     return rules
 
@@ -157,6 +142,40 @@ df = retail_data_prep(df)
 rules = create_rules(df)
 rules.head()
 
+## 2.3 : Incremental mode -- update the rules when new invoices arrive instead of mining all invoices again.
+
+df_germany = df[df['Country'] == "Germany"]
+old_invoices = df_germany[df_germany["InvoiceDate"] < "2011-10-01"]
+new_invoices = df_germany[df_germany["InvoiceDate"] >= "2011-10-01"]
+
+# mine the old invoices once. itemset counts and the number of invoices are kept in the miner.
+old_basket_matrix, _, old_item_ids = create_basket_matrix(old_invoices)
+miner = IncrementalRuleMiner(min_support=0.01).fit(old_basket_matrix, old_item_ids)
+# only the new invoices are scanned to update the counts.
+new_basket_matrix, _, new_item_ids = create_basket_matrix(new_invoices)
+miner.update(new_basket_matrix, new_item_ids)
+updated_rules = miner.rules(metric="support", min_threshold=0.01)
+
+## 2.4 : Rules for every country at once. Transactions are encoded once and every country is mined separately.
+# n_jobs=None mines the countries in parallel worker processes (all CPUs). Worker processes started with spawn or
+# forkserver (macOS, Windows, Linux from Python 3.14) import the calling script again, so this top-level script
+# mines in one process. Call it with n_jobs=None only from code under if __name__ == "__main__":.
+
+rules_by_country, country_timings = create_segment_rules(df, segment_col="Country", n_jobs=1)
+rules_by_country["Germany"].head()
+country_timings.sort_values("seconds", ascending=False)
+
+## 2.5 : Out-of-core mining -- data larger than memory is mined in chunks with two passes (SON).
+# read_chunks returns a new iterator of cleaned chunks on every call, for example:
+#   thresholds, _ = retail_data_prep_chunks(lambda: pd.read_csv("online_retail.csv", chunksize=500000))
+#   read_chunks = lambda: (retail_data_prep(chunk, thresholds=thresholds)
+#                          for chunk in pd.read_csv("online_retail.csv", chunksize=500000))
+# Here the cleaned German invoices are read in chunks of 5000 rows. The itemsets are the same as apriori's.
+
+read_chunks = lambda: (df_germany.iloc[start:start + 5000] for start in range(0, len(df_germany), 5000))
+son_itemsets = son_frequent_itemsets(read_chunks, min_support=0.01, n_jobs=1)
+son_rules = association_rules(son_itemsets, metric="support", min_threshold=0.01)
+
 
 
 ########################
@@ -170,17 +189,15 @@ rules.head()
 # product_id of User 3: 22747
 
 
-def check_id(dataframe, stock_code):
-    product_name = dataframe[dataframe["StockCode"] == stock_code][["Description"]].values[0].tolist()
-    print(product_name)
+catalog = ProductCatalog(df)
 
 product_id_1 = 21987
 product_id_2 = 23235
 product_id_3 = 22747
 
-product_1 = check_id(df, product_id_1)
-product_2 = check_id(df, product_id_2)
-product_3 = check_id(df, product_id_3)
+product_1 = check_id(catalog, product_id_1)
+product_2 = check_id(catalog, product_id_2)
+product_3 = check_id(catalog, product_id_3)
 
 ## 3.2 : Make product recommendations for 3 users using the "arl_recommender" function.
 
@@ -225,24 +242,48 @@ arl_recommender(rules, product_id_1, 1)
 arl_recommender(rules, product_id_2, 2)
 arl_recommender(rules, product_id_3, 2)
 
+# arl_recommender sorts all rules on every call. For repeated calls (e.g. every page view)
+# build the rule index once and get the same recommendations with a lookup.
+rule_index = RuleIndex(rules)
+rule_index.recommend(product_id_1, metric="lift", rec_count=1)
+rule_index.recommend(product_id_2, metric="lift", rec_count=2)
+rule_index.recommend(product_id_3, metric="lift", rec_count=2)
+catalog.bulk_names(rule_index.recommend(product_id_3, metric="lift", rec_count=2))
+
+# save the rules as plain arrays once. serving processes load them as memory-mapped files.
+save_rules(rules, "datasets/rules/germany")
+mapped_rules = load_rules("datasets/rules/germany")
+mapped_rules.recommend(product_id_1, metric="lift", rec_count=1)
+
+# the recommender reads only the best rules of each product. keeping the best 5 rules (by lift) of each antecedent
+# gives the same lift recommendations with a much smaller rule table. memory_budget caps the size of the table.
+top_rules = topk_association_rules(apriori(create_invoice_product_df(df[df['Country'] == "Germany"], id=True),
+                                           min_support=0.01, use_colnames=True),
+                                   metric="lift", k=5, memory_budget=50_000_000)
+len(rules), len(top_rules)
+RuleIndex(top_rules).recommend(product_id_1, metric="lift", rec_count=1)
+
+# recommendations for many baskets at once. baskets can have more than one product.
+# a rule is used if all products of its antecedent are in the basket.
+basket_matrix, basket_ids, item_ids = create_basket_matrix(df[df['Country'] == "Germany"], "Invoice", "StockCode")
+basket_recommendations = rule_index.recommend_baskets(basket_matrix, item_ids, metric="lift", rec_count=2,
+                                                      basket_ids=basket_ids)
+
 
 ## 3.3: Get the names of recommended products.
 
-def recommended_item_names(dataframe, rules_df, product_id, rec_count):
+def recommended_item_names(catalog, rules_df, product_id, rec_count):
     # recommended item list 
     rec_item_list = arl_recommender(rules_df, product_id, rec_count)
-    recommendation_list = []
-    for item_id in rec_item_list:
-        item_name = check_id(dataframe, item_id)
-        recommendation_list.append(item_name)
-    return recommendation_list
+    # names of all recommended items with one bulk lookup.
+    return catalog.bulk_names(rec_item_list).tolist()
 
-recommended_items_1 = recommended_item_names(df, rules, product_id_1, 1)
-recommended_items_2 = recommended_item_names(df, rules, product_id_2, 2)
+recommended_items_1 = recommended_item_names(catalog, rules, product_id_1, 1)
+recommended_items_2 = recommended_item_names(catalog, rules, product_id_2, 2)
 # ['SET OF TEA COFFEE SUGAR TINS PANTRY']
 # ['ROUND STORAGE TIN VINTAGE LEAF']
 
-recommended_items_3 = recommended_item_names(df, rules, product_id_3, 2)
+recommended_items_3 = recommended_item_names(catalog, rules, product_id_3, 2)
 
 
 
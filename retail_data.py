@@ -0,0 +1,322 @@
+############################################
+# ONLINE RETAIL DATA (Columnar Cache)
+############################################
+
+# Reading online_retail_II.xlsx with pd.read_excel takes minutes. load_retail_data converts the sheet once into
+# a columnar cache and reads the cache in the next runs:
+#   - text columns (Invoice, StockCode, Description, Country) are stored as int32 codes + a category list,
+#   - numeric and date columns are stored as typed numpy arrays,
+#   - rows are partitioned by Country, so only the partitions and columns that are needed are read.
+# The cache is rebuilt when the source file changes (modification time and size, then content hash).
+
+# 1. Building the Cache
+# 2. Loading the Cache
+# 3. Data Preparation
+# 4. Streaming Data Preparation (for data larger than memory)
+# 5. Product Catalog (StockCode -> Description)
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from file_cache import CACHE_DIR, cache_is_valid, source_cache_path, source_meta
+
+
+RETAIL_DATA_PATH = "datasets/online_retail_II.xlsx"
+
+
+############################################
+# 1. Building the Cache
+############################################
+
+def _cache_path(path, sheet_name, cache_dir):
+    return source_cache_path(path, cache_dir, suffix="_" + sheet_name)
+
+
+def _json_value(value):
+    # numpy scalars are converted to Python ints/floats/strings.
+    return value.item() if hasattr(value, "item") else value
+
+
+def build_retail_cache(path=RETAIL_DATA_PATH, sheet_name="Year 2010-2011", cache_dir=CACHE_DIR,
+                       partition_col="Country"):
+    '''
+    Read the excel sheet once and write the columnar cache.
+    returns:
+        cache directory.
+    '''
+    cache_path = _cache_path(path, sheet_name, cache_dir)
+    os.makedirs(cache_path, exist_ok=True)
+    dataframe = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
+
+    arrays, columns = {}, []
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            kind = "datetime"
+            arrays[column] = values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        elif pd.api.types.is_numeric_dtype(values):
+            kind = "numeric"
+            arrays[column] = values.to_numpy()
+        else:
+            # text columns may mix ints and strings (e.g. StockCode). categories keep the original types.
+            kind = "category"
+            codes, categories = pd.factorize(values)
+            arrays[column] = codes.astype(np.int32)
+            with open(os.path.join(cache_path, "categories_%d.json" % len(columns)), "w") as file:
+                json.dump([_json_value(category) for category in categories], file)
+        columns.append({"name": column, "kind": kind})
+
+    # rows of each partition are written to a separate npz file. np.load reads only the requested columns.
+    # "row" keeps the row numbers of the excel sheet to restore the original order and index.
+    partition_codes, partition_values = pd.factorize(dataframe[partition_col], use_na_sentinel=False)
+    partitions = {}
+    for code, value in enumerate(partition_values):
+        rows = np.flatnonzero(partition_codes == code)
+        file_name = "part_%d.npz" % code
+        np.savez(os.path.join(cache_path, file_name), row=rows.astype(np.int64),
+                 **{str(i): arrays[column["name"]][rows] for i, column in enumerate(columns)})
+        partitions[str(value)] = file_name
+
+    meta = dict(source_meta(path), sheet_name=sheet_name, columns=columns, partition_col=partition_col,
+                partitions=partitions)
+    with open(os.path.join(cache_path, "meta.json"), "w") as file:
+        json.dump(meta, file)
+    return cache_path
+
+
+############################################
+# 2. Loading the Cache
+############################################
+
+def load_retail_data(path=RETAIL_DATA_PATH, sheet_name="Year 2010-2011", countries=None, columns=None,
+                     cache_dir=CACHE_DIR, categorical=False):
+    '''
+    parameters:
+        path: online retail excel file.
+        sheet_name: sheet to read.
+        countries: list of countries to read. If None, all countries are read.
+        columns: list of columns to read. If None, all columns are read.
+        cache_dir: directory of the cache. The cache is created on the first call.
+        categorical: return text columns as pandas categoricals instead of object columns.
+    returns:
+        dataframe with the same columns and values as pd.read_excel(path, sheet_name=sheet_name).
+    '''
+    cache_path = _cache_path(path, sheet_name, cache_dir)
+    if not cache_is_valid(path, cache_path):
+        build_retail_cache(path, sheet_name, cache_dir)
+    with open(os.path.join(cache_path, "meta.json")) as file:
+        meta = json.load(file)
+
+    selected = [(i, column) for i, column in enumerate(meta["columns"])
+                if columns is None or column["name"] in columns]
+    if countries is None:
+        files = list(meta["partitions"].values())
+    else:
+        files = [meta["partitions"][str(country)] for country in countries if str(country) in meta["partitions"]]
+
+    parts = []
+    for file_name in files:
+        with np.load(os.path.join(cache_path, file_name)) as part:
+            parts.append({key: part[key] for key in ["row"] + [str(i) for i, _ in selected]})
+
+    def concat(key):
+        return np.concatenate([part[key] for part in parts]) if parts else np.array([], dtype=np.int64)
+
+    rows = concat("row")
+    order = np.argsort(rows, kind="stable")
+    dataframe = {}
+    for i, column in selected:
+        values = concat(str(i))[order]
+        if column["kind"] == "category":
+            with open(os.path.join(cache_path, "categories_%d.json" % i)) as file:
+                categories = json.load(file)
+            values = pd.Categorical.from_codes(values.astype(np.int32), categories=pd.Index(categories, dtype=object))
+            if not categorical:
+                values = np.asarray(values, dtype=object)
+        elif column["kind"] == "datetime":
+            values = values.astype(np.int64).view("datetime64[ns]")
+        dataframe[column["name"]] = values
+    return pd.DataFrame(dataframe, index=pd.Index(rows[order]))
+
+
+############################################
+# 3. Data Preparation
+############################################
+
+# retail_data_prep builds one boolean mask for all filters, copies the selected rows once and
+# clips the outliers with np.clip. Cancelled invoices and POST rows are found with exact prefix tests.
+
+def outlier_thresholds(values, q1=0.01, q3=0.99):
+    quartile1, quartile3 = np.quantile(values, [q1, q3]) if len(values) else (np.nan, np.nan)
+    interquantile_range = quartile3 - quartile1
+    up_limit = quartile3 + 1.5 * interquantile_range
+    low_limit = quartile1 - 1.5 * interquantile_range
+    return low_limit, up_limit
+
+
+def retail_mask(dataframe, drop_stock_codes=("POST",)):
+    '''
+    returns:
+        boolean array of the rows to keep: no missing values, not cancelled ("C" invoices),
+        StockCode does not start with drop_stock_codes, Quantity and Price are greater than zero.
+    '''
+    mask = dataframe.notna().all(axis=1).to_numpy(dtype=bool, copy=True)
+    # numeric invoice numbers and stock codes are not strings. na=False keeps them.
+    mask &= ~dataframe["Invoice"].str.startswith("C", na=False).to_numpy(dtype=bool)
+    if drop_stock_codes:
+        mask &= ~dataframe["StockCode"].str.startswith(tuple(drop_stock_codes), na=False).to_numpy(dtype=bool)
+    mask &= dataframe["Quantity"].to_numpy() > 0
+    mask &= dataframe["Price"].to_numpy() > 0
+    return mask
+
+
+def retail_data_prep(dataframe, drop_stock_codes=("POST",), thresholds=None):
+    '''
+    parameters:
+        dataframe: online retail dataframe.
+        drop_stock_codes: StockCode prefixes to drop. POST is the postage added to invoices, not a product.
+        thresholds: dictionary -- variable: (low_limit, up_limit). If None, thresholds are calculated
+                    from the filtered data with outlier_thresholds.
+    returns:
+        new dataframe. Quantity and Price outliers are replaced with the threshold values.
+    '''
+    mask = retail_mask(dataframe, drop_stock_codes)
+    columns = {column: dataframe[column].to_numpy()[mask] for column in dataframe.columns}
+    for variable in ("Quantity", "Price"):
+        values = columns[variable].astype(np.float64)
+        low_limit, up_limit = thresholds[variable] if thresholds else outlier_thresholds(values)
+        columns[variable] = np.clip(values, low_limit, up_limit)
+    return pd.DataFrame(columns, index=dataframe.index[mask])
+
+
+############################################
+# 4. Streaming Data Preparation
+############################################
+
+# For data that does not fit into memory the rows are read in chunks twice:
+#   1. pass: filter each chunk and add its Quantity and Price values to quantile sketches.
+#   2. pass: filter each chunk again and clip it with the thresholds estimated from the sketches.
+
+class QuantileSketch:
+    '''
+    Approximate quantiles of a stream with bounded memory (a simple KLL-style sketch).
+    Values are kept in levels. Level l holds values with weight 2**l. When a level has more than k values,
+    they are sorted and every second value (random offset) moves to the next level.
+    parameters:
+        k: maximum number of values per level. Rank error is about (number of levels) / k.
+    '''
+
+    def __init__(self, k=4096, seed=42):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.k:
+                values = np.sort(self.levels[level])
+                # an odd value out stays in this level.
+                keep = values[len(values) - len(values) % 2:]
+                promoted = values[self.rng.integers(2):len(values) - len(values) % 2:2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q):
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return np.nan
+        weights = np.concatenate([np.full(len(values_), 2.0 ** level) for level, values_ in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return values[order][min(position, len(values) - 1)]
+
+
+def retail_data_prep_chunks(read_chunks, drop_stock_codes=("POST",), k=4096):
+    '''
+    parameters:
+        read_chunks: function that returns a new iterator of dataframe chunks on every call,
+                     e.g. lambda: pd.read_csv("online_retail.csv", chunksize=500000).
+        drop_stock_codes: same as retail_data_prep.
+        k: size of the quantile sketches.
+    returns:
+        thresholds: dictionary -- variable: (low_limit, up_limit) estimated in the first pass.
+        generator of cleaned chunks (second pass).
+    '''
+    sketches = {"Quantity": QuantileSketch(k), "Price": QuantileSketch(k)}
+    for chunk in read_chunks():
+        mask = retail_mask(chunk, drop_stock_codes)
+        for variable, sketch in sketches.items():
+            sketch.update(chunk[variable].to_numpy(dtype=np.float64)[mask])
+
+    thresholds = {}
+    for variable, sketch in sketches.items():
+        quartile1, quartile3 = sketch.quantile(0.01), sketch.quantile(0.99)
+        interquantile_range = quartile3 - quartile1
+        thresholds[variable] = (quartile1 - 1.5 * interquantile_range, quartile3 + 1.5 * interquantile_range)
+
+    def cleaned_chunks():
+        for chunk in read_chunks():
+            yield retail_data_prep(chunk, drop_stock_codes, thresholds)
+
+    return thresholds, cleaned_chunks()
+
+
+############################################
+# 5. Product Catalog
+############################################
+
+# check_id filters the whole dataframe to find the name of one product. ProductCatalog is built once
+# from the cleaned data and keeps the most frequent Description of each StockCode.
+
+class ProductCatalog:
+    '''
+    parameters:
+        dataframe: cleaned transactions dataframe.
+        id_col: product id column.
+        name_col: product name column.
+    '''
+
+    def __init__(self, dataframe, id_col="StockCode", name_col="Description"):
+        valid = dataframe[id_col].notna().to_numpy() & dataframe[name_col].notna().to_numpy()
+        id_codes, ids = pd.factorize(dataframe[id_col].to_numpy()[valid])
+        name_codes, names = pd.factorize(dataframe[name_col].to_numpy()[valid])
+
+        # number of rows of each (id, name) pair. the most frequent name of each id is kept.
+        pairs, counts = np.unique(id_codes.astype(np.int64) * len(names) + name_codes, return_counts=True)
+        pair_ids, pair_names = np.divmod(pairs, len(names))
+        order = np.lexsort((pair_names, -counts, pair_ids))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = pair_ids[order][1:] != pair_ids[order][:-1]
+        first = order[is_first]
+
+        self.ids = pd.Index(ids[pair_ids[first]])
+        self.names = np.asarray(names, dtype=object)[pair_names[first]]
+        self.lookup = dict(zip(self.ids, self.names))
+
+    def name(self, product_id, default=None):
+        # single lookup
+        return self.lookup.get(product_id, default)
+
+    def bulk_names(self, product_ids, default=None):
+        '''
+        returns:
+            numpy array of product names. default for unknown product ids.
+        '''
+        positions = self.ids.get_indexer(pd.Index(product_ids, dtype=object))
+        if len(self.names) == 0:
+            # empty catalog: -1 positions cannot index the names.
+            return np.full(len(positions), default, dtype=object)
+        result = np.where(positions >= 0, self.names[positions], default)
+        return result.astype(object)
+
+    def __len__(self):
+        return len(self.ids)
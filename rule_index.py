@@ -0,0 +1,316 @@
+############################################
+# RULE INDEX (Antecedent Inverted Index)
+############################################
+
+# arl_recommender_metric sorts the whole rules dataframe and walks every antecedent on each call.
+# RuleIndex does that work once: it maps each item to the rules whose antecedents contain it
+# and keeps these rule lists pre-sorted for every metric. A recommendation is then a dictionary lookup
+# and a slice of the first rec_count rules.
+
+# 1. Rule Index
+# 2. Rule Files (memory-mapped rule sets)
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+METRICS = ("support", "confidence", "lift", "leverage", "conviction")
+
+
+############################################
+# 1. Rule Index
+############################################
+
+def metric_ranks(values):
+    # rank 0 is the rule with the highest metric value. NaN values are ranked last.
+    order = np.argsort(-np.asarray(values, dtype=np.float64), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def item_indptr(pair_codes, n_items):
+    # (item, rule) pairs of item code c are at indptr[c]:indptr[c + 1] after sorting the pairs by item code.
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_codes, minlength=n_items), out=indptr[1:])
+    return indptr
+
+
+def item_rule_lists(pair_codes, pair_rules, rank):
+    # rules of the (item, rule) pairs sorted by item code, then by rank.
+    pair_order = np.lexsort((rank[pair_rules], pair_codes))
+    return pair_rules[pair_order].astype(np.int32)
+
+
+class RuleIndex:
+    '''
+    parameters:
+        rules_df: association rules dataframe (output of mlxtend association_rules).
+        metrics: metrics to build sorted rule lists for.
+    '''
+
+    def __init__(self, rules_df, metrics=METRICS):
+        self.metrics = tuple(metric for metric in metrics if metric in rules_df.columns)
+        self.n_rules = len(rules_df)
+
+        # first product of each consequent(Y) -- the product that arl_recommender recommends for a rule.
+        self.first_consequents = np.array([next(iter(items)) for items in rules_df["consequents"]], dtype=object)
+        self.consequents = rules_df["consequents"].to_numpy()
+        self.metric_values = {metric: rules_df[metric].to_numpy(dtype=np.float64) for metric in self.metrics}
+
+        # (item, rule) pairs of every antecedent(X).
+        self.antecedent_lens = rules_df["antecedents"].map(len).to_numpy(dtype=np.int64)
+        pair_rules = np.repeat(np.arange(self.n_rules), self.antecedent_lens)
+        pair_items = [item for items in rules_df["antecedents"] for item in items]
+
+        # item vocabulary -- item: code
+        self.item_codes = {}
+        pair_codes = np.array([self.item_codes.setdefault(item, len(self.item_codes)) for item in pair_items],
+                              dtype=np.int64)
+        self.items = np.array(list(self.item_codes), dtype=object)
+        # integer code of the first consequent of each rule.
+        self.first_consequent_codes, self.consequent_items = pd.factorize(self.first_consequents)
+
+        # antecedent incidence matrix -- rows: item codes, columns: rules. used for batch recommendations.
+        self.antecedent_matrix = sparse.csr_matrix((np.ones(len(pair_codes), dtype=np.int32), (pair_codes, pair_rules)),
+                                                   shape=(len(self.item_codes), self.n_rules))
+
+        # rules of item code c are rule_ids[metric][indptr[c]:indptr[c + 1]], sorted by metric in descending order.
+        self.indptr = item_indptr(pair_codes, len(self.item_codes))
+        self.ranks = {metric: metric_ranks(self.metric_values[metric]) for metric in self.metrics}
+        self.rule_ids = {metric: item_rule_lists(pair_codes, pair_rules, self.ranks[metric])
+                         for metric in self.metrics}
+
+    def item_rules(self, product_id, metric="lift"):
+        '''
+        returns:
+            positions (in rules_df) of the rules whose antecedents contain product_id, sorted by metric.
+        '''
+        code = self.item_codes.get(product_id)
+        if code is None:
+            return self.rule_ids[metric][:0]
+        return self.rule_ids[metric][self.indptr[code]:self.indptr[code + 1]]
+
+    def recommend(self, product_id, metric="lift", rec_count=1, unique=False):
+        '''
+        parameters:
+            product_id: id of the product that is in the basket to be used for recommendations.
+            metric: metric for sorting the rules.
+            rec_count: number of recommended products.
+            unique: do not recommend the same product more than once.
+        returns:
+            first consequent items of the rec_count best rules whose antecedents contain product_id.
+            rules are ordered by metric in descending order; rules with equal metric values keep their order in
+            rules_df (stable sort). arl_recommender_metric sorts ties with an unstable sort, so its list can differ
+            when rules tie on the metric (e.g. support).
+        '''
+        rules = self.item_rules(product_id, metric)
+        if not unique:
+            return self.first_consequents[rules[:rec_count]].tolist()
+
+        # stop as soon as rec_count different products are found.
+        recommendation_list = []
+        for rule in rules:
+            product = self.first_consequents[rule]
+            if product not in recommendation_list:
+                recommendation_list.append(product)
+                if len(recommendation_list) == rec_count:
+                    break
+        return recommendation_list
+
+    def recommend_baskets(self, basket_matrix, item_ids, metric="lift", rec_count=1, basket_ids=None,
+                          batch_size=100000):
+        '''
+        parameters:
+            basket_matrix: boolean scipy sparse matrix -- rows: baskets, columns: items.
+            item_ids: item labels of the matrix columns.
+            metric: metric for sorting the rules.
+            rec_count: number of recommended products for each basket.
+            basket_ids: basket labels of the matrix rows. If None, row positions are used.
+            batch_size: number of baskets that are matched at once (bounds the memory of the match matrix).
+        returns:
+            dataframe with columns basket, rank, product_id and metric -- rec_count rows at most for each basket.
+            A rule matches a basket if all items of its antecedent(X) are in the basket. The first product of
+            its consequent(Y) is recommended unless it is already in the basket. Each product is recommended
+            once per basket with the best matching rule.
+        '''
+        basket_matrix = sparse.csr_matrix(basket_matrix, dtype=np.int32)
+        item_index = pd.Index(item_ids)
+
+        # rules sorted by metric. column r of the antecedent matrix is the rule with rank r.
+        order = np.argsort(self.ranks[metric])
+        # basket columns that appear in any antecedent and their rows in the antecedent matrix.
+        codes = np.array([self.item_codes.get(item, -1) for item in item_index], dtype=np.int64)
+        columns = np.flatnonzero(codes >= 0)
+        antecedent_matrix = self.antecedent_matrix[codes[columns]][:, order]
+        antecedent_lens = self.antecedent_lens[order]
+        products = self.first_consequent_codes[order]
+        n_products = len(self.consequent_items)
+        # basket column of the first consequent of each rule (-1 if the product is not a basket column).
+        consequent_columns = item_index.get_indexer(self.first_consequents[order])
+
+        results = []
+        for start in range(0, basket_matrix.shape[0], batch_size):
+            batch = basket_matrix[start:start + batch_size]
+            # number of antecedent items of each rule that are in each basket.
+            matches = (batch[:, columns] @ antecedent_matrix).tocsr()
+            baskets = np.repeat(np.arange(batch.shape[0], dtype=np.int64), np.diff(matches.indptr))
+            full = matches.data == antecedent_lens[matches.indices]
+            # matching rules of each basket from the best to the worst. rules are rank positions (see order).
+            keys = np.sort(baskets[full] * self.n_rules + matches.indices[full])
+            baskets, rules = np.divmod(keys, self.n_rules)
+
+            # do not recommend products that are already in the basket.
+            in_basket = np.zeros(len(rules), dtype=bool)
+            known = consequent_columns[rules] >= 0
+            batch_keys = batch.tocoo()
+            batch_keys = batch_keys.row.astype(np.int64) * batch.shape[1] + batch_keys.col
+            in_basket[known] = np.isin(baskets[known] * batch.shape[1] + consequent_columns[rules[known]], batch_keys)
+            baskets, rules = baskets[~in_basket], rules[~in_basket]
+
+            # keep one rule (the best one) per (basket, product).
+            _, first = np.unique(baskets * n_products + products[rules], return_index=True)
+            first.sort()
+            baskets, rules = baskets[first], rules[first]
+
+            # keep the first rec_count products of every basket.
+            group_starts = np.flatnonzero(np.r_[True, baskets[1:] != baskets[:-1]])
+            positions = np.arange(len(baskets)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(baskets)]))
+            keep = positions < rec_count
+            results.append(pd.DataFrame({"basket": baskets[keep] + start,
+                                         "rank": positions[keep] + 1,
+                                         "product_id": self.first_consequents[order[rules[keep]]],
+                                         metric: self.metric_values[metric][order[rules[keep]]]}))
+
+        if not results:
+            return pd.DataFrame(columns=["basket", "rank", "product_id", metric])
+        recommendations = pd.concat(results, ignore_index=True)
+        if basket_ids is not None:
+            recommendations["basket"] = np.asarray(basket_ids)[recommendations["basket"].to_numpy()]
+        return recommendations
+
+
+############################################
+# 2. Rule Files
+############################################
+
+# A rules dataframe keeps a frozenset object for each antecedent and consequent, so it can only be pickled.
+# save_rules writes a rule set as plain arrays:
+#   - vocabulary.json: item labels. itemsets are stored as item codes (positions in the vocabulary).
+#   - antecedent_offsets / antecedent_items (int32): items of rule i are items[offsets[i]:offsets[i + 1]].
+#     consequent_offsets / consequent_items are the same for consequents.
+#   - one float32 array for each metric.
+#   - item_indptr and <metric>_rule_ids (int32): the inverted index of RuleIndex.
+# load_rules maps the arrays with np.load(mmap_mode="r"). Serving processes share the same pages and
+# no Python object is created per rule.
+
+def save_rules(rules_df, path, metrics=METRICS):
+    '''
+    parameters:
+        rules_df: association rules dataframe.
+        path: directory to write the arrays to.
+        metrics: metric columns to save.
+    '''
+    os.makedirs(path, exist_ok=True)
+    metrics = [metric for metric in metrics if metric in rules_df.columns]
+
+    # items are kept in frozenset iteration order, so the first consequent item is the one arl_recommender uses.
+    antecedents = [list(items) for items in rules_df["antecedents"]]
+    consequents = [list(items) for items in rules_df["consequents"]]
+    flat_items = pd.Series([item for items in antecedents + consequents for item in items], dtype=object)
+    codes, vocabulary = pd.factorize(flat_items)
+    codes = codes.astype(np.int32)
+
+    antecedent_lens = np.array([len(items) for items in antecedents], dtype=np.int64)
+    consequent_lens = np.array([len(items) for items in consequents], dtype=np.int64)
+    n_antecedent_items = int(antecedent_lens.sum())
+    arrays = {"antecedent_offsets": np.r_[0, np.cumsum(antecedent_lens)].astype(np.int32),
+              "antecedent_items": codes[:n_antecedent_items],
+              "consequent_offsets": np.r_[0, np.cumsum(consequent_lens)].astype(np.int32),
+              "consequent_items": codes[n_antecedent_items:]}
+
+    # inverted index: item code -> rules whose antecedents contain the item, sorted by each metric.
+    pair_rules = np.repeat(np.arange(len(rules_df)), antecedent_lens)
+    pair_codes = arrays["antecedent_items"].astype(np.int64)
+    arrays["item_indptr"] = item_indptr(pair_codes, len(vocabulary)).astype(np.int32)
+    for metric in metrics:
+        values = rules_df[metric].to_numpy(dtype=np.float64)
+        arrays[metric] = values.astype(np.float32)
+        arrays[metric + "_rule_ids"] = item_rule_lists(pair_codes, pair_rules, metric_ranks(values))
+
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+    with open(os.path.join(path, "vocabulary.json"), "w") as file:
+        # numpy scalars are converted to Python ints/strings.
+        json.dump({"items": [item.item() if hasattr(item, "item") else item for item in vocabulary],
+                   "metrics": metrics}, file)
+
+
+def load_rules(path):
+    '''
+    returns:
+        MappedRules object that reads the arrays written by save_rules from memory-mapped files.
+    '''
+    return MappedRules(path)
+
+
+class MappedRules:
+    def __init__(self, path):
+        with open(os.path.join(path, "vocabulary.json")) as file:
+            meta = json.load(file)
+        self.items = meta["items"]
+        self.metrics = tuple(meta["metrics"])
+        self.item_codes = {item: code for code, item in enumerate(self.items)}
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+        self.antecedent_offsets = load("antecedent_offsets")
+        self.antecedent_items = load("antecedent_items")
+        self.consequent_offsets = load("consequent_offsets")
+        self.consequent_items = load("consequent_items")
+        self.item_indptr = load("item_indptr")
+        self.metric_values = {metric: load(metric) for metric in self.metrics}
+        self.rule_ids = {metric: load(metric + "_rule_ids") for metric in self.metrics}
+
+    def __len__(self):
+        return len(self.antecedent_offsets) - 1
+
+    def antecedents(self, rule):
+        return [self.items[code] for code in self.antecedent_items[self.antecedent_offsets[rule]:
+                                                                   self.antecedent_offsets[rule + 1]]]
+
+    def consequents(self, rule):
+        return [self.items[code] for code in self.consequent_items[self.consequent_offsets[rule]:
+                                                                   self.consequent_offsets[rule + 1]]]
+
+    def item_rules(self, product_id, metric="lift"):
+        # same as RuleIndex.item_rules, read from the mapped arrays.
+        code = self.item_codes.get(product_id)
+        if code is None:
+            return self.rule_ids[metric][:0]
+        return self.rule_ids[metric][self.item_indptr[code]:self.item_indptr[code + 1]]
+
+    def recommend(self, product_id, metric="lift", rec_count=1):
+        '''
+        returns:
+            same list as RuleIndex.recommend (ties on the metric in rules_df order).
+        '''
+        rules = self.item_rules(product_id, metric)[:rec_count]
+        # first item of each consequent(Y).
+        return [self.items[code] for code in self.consequent_items[self.consequent_offsets[rules]]]
+
+    def to_dataframe(self):
+        '''
+        returns:
+            rules dataframe with antecedents, consequents and the saved metric columns.
+        '''
+        rules_df = pd.DataFrame({"antecedents": [frozenset(self.antecedents(rule)) for rule in range(len(self))],
+                                 "consequents": [frozenset(self.consequents(rule)) for rule in range(len(self))]})
+        for metric in self.metrics:
+            rules_df[metric] = np.asarray(self.metric_values[metric])
+        return rules_df
@@ -19,6 +19,8 @@
 #############################################
 
 import pandas as pd
+from interaction_matrix import create_interaction_matrix, to_frame
+from movielens_data import load_movies, load_ratings
 
 # all columns will be shown.
 pd.set_option('display.max_columns', None)
@@ -29,16 +31,12 @@ pd.set_option('display.expand_frame_repr', False)
 
 def create_user_movie_df():
     import pandas as pd
-    movie = pd.read_csv('datasets/movie.csv')
-    rating = pd.read_csv('datasets/ratings_small.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    # number of ratings for each movie
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 1000].index
-    # common movies that are rated more than 1000 times
-    common_movies = df[~df["title"].isin(rare_movies)]
-    # create pivot table
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
+    movie = load_movies('datasets/movie.csv')
+    rating = load_ratings('datasets/ratings_small.csv')
+    # sparse user-movie ratings of common movies that are rated more than 1000 times
+    interactions = create_interaction_matrix(rating, rare_count=1000)
+    # user-movie dataframe -- index: userId, columns: movie titles
+    user_movie_df = to_frame(interactions, movie)
     return user_movie_df
 
 
@@ -176,7 +174,7 @@ top_users.rename(columns={"user_id_2": "userId"}, inplace=True)
 
 
 # merge 'rating.csv' top_users to add movieId and rating information.
-rating = pd.read_csv('datasets/rating.csv')
+rating = load_ratings('datasets/rating.csv')
 top_users_ratings = top_users.merge(rating[["userId", "movieId", "rating"]], how='inner')
 # userId, corr, movieId, rating
 
@@ -205,7 +203,7 @@ recommendation_df["weighted_rating"].max()  # 34.17
 movies_to_recommend = recommendation_df[recommendation_df["weighted_rating"] > 3.5].sort_values("weighted_rating",
                                                                                                    ascending=False)
 
-movie = pd.read_csv('datasets/movie.csv')
+movie = load_movies('datasets/movie.csv')
 
 # add movie titles
 movies_to_recommend=movies_to_recommend.merge(movie[["movieId", "title"]])
@@ -219,16 +217,12 @@ movies_to_recommend=movies_to_recommend.merge(movie[["movieId", "title"]])
 
 def create_user_movie_df():
     import pandas as pd
-    movie = pd.read_csv('datasets/movie.csv')
-    rating = pd.read_csv('datasets/rating.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    # number of ratings for each movie
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 1000].index
-    # common movies that are rated more than 1000 times
-    common_movies = df[~df["title"].isin(rare_movies)]
-    # create pivot table
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
+    movie = load_movies('datasets/movie.csv')
+    rating = load_ratings('datasets/rating.csv')
+    # sparse user-movie ratings of common movies that are rated more than 1000 times
+    interactions = create_interaction_matrix(rating, rare_count=1000)
+    # user-movie dataframe -- index: userId, columns: movie titles
+    user_movie_df = to_frame(interactions, movie)
     return user_movie_df
 
 
@@ -270,7 +264,7 @@ def user_based_recommender(random_user, user_movie_df, ratio=60, cor_th=0.65, sc
     top_users.rename(columns={"user_id_2": "userId"}, inplace=True)
 
     # add rating information to top_users: top_users_rating.
-    rating = pd.read_csv('datasets/rating.csv')
+    rating = load_ratings('datasets/rating.csv')
     top_users_ratings = top_users.merge(rating[["userId", "movieId", "rating"]], how='inner')
 
     # calculate weighted_rating= corr * rating
@@ -283,7 +277,7 @@ def user_based_recommender(random_user, user_movie_df, ratio=60, cor_th=0.65, sc
     # return movieId, weighted_rating and title information for movies with mean weighted_rating greater than 'score'
     movies_to_be_recommend = recommendation_df[recommendation_df["weighted_rating"] > score].sort_values(
         "weighted_rating", ascending=False)
-    movie = pd.read_csv('datasets/movie.csv')
+    movie = load_movies('datasets/movie.csv')
     return movies_to_be_recommend.merge(movie[["movieId", "title"]])
 
 # select a random_user